@@ -1,13 +1,30 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, g, request, jsonify, send_from_directory
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
 from llm_client import AzureLLMClient
 from wolfram_tool import get_available_tools, execute_wolfram_tool
-import json
+from response_cache import LLMCache
+from semantic_cache import SemanticCache
+from coalescer import Coalescer
+from session_store import SessionStore, SESSION_TTL
+from pdf_extract import extract_page_texts
+import hashlib
 import logging
 import os
-import PyPDF2
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import orjson
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
+from werkzeug.utils import secure_filename
+import fitz  # PyMuPDF
 from pathlib import Path
 import re
+import tempfile
+import time
+import math
+from collections import Counter
 
 from db import (
     init_db,
@@ -16,64 +33,109 @@ from db import (
     get_recent_chat_history,
     find_similar_past_question,
     get_mistakes,
+    get_mistakes_version,
     add_mistake as db_add_mistake,
     delete_mistake as db_delete_mistake,
     get_study_plan,
     save_study_plan,
 )
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (LOG_LEVEL=INFO or DEBUG for verbose request logs during development)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper())
 logger = logging.getLogger(__name__)
 
+class ORJSONProvider(JSONProvider):
+    """Route jsonify() and request.get_json() through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)  # Enable CORS for React frontend
+app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # rejected by Werkzeug before the body is read
+# Compress JSON bodies; SSE is left uncompressed so tokens are flushed as they arrive
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_STREAMS'] = False
+# Behind nginx/Apache, let the proxy send uploaded files itself (sendfile) instead of Python
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE') == '1'
+Compress(app)
 
 # Initialize database and Azure LLM client
 init_db()
 llm_client = AzureLLMClient()
+TOOLS = get_available_tools()  # static tool schemas, built once per process
+MAX_TOOL_WORKERS = 8
+# Tool name -> handler taking the parsed arguments; register new tools here
+TOOL_DISPATCH = {
+    'solve_math_problem': lambda args: execute_wolfram_tool(args['problem']),
+}
+# Bound per-request LLM input regardless of what the client sends
+MAX_CHAT_BODY_BYTES = 1_000_000
+MAX_HISTORY_TURNS = 20
+MAX_HISTORY_CHARS = 48_000  # ~12k tokens, leaves room for the system prompt and documents
+response_cache = LLMCache()
+semantic_cache = SemanticCache(llm_client.get_embedding, enabled=bool(llm_client.embedding_endpoint))
+session_store = SessionStore()
+# Identical requests already waiting on Azure share that call instead of issuing their own
+llm_coalescer = Coalescer()
 
 # Set up uploads directory (inside backend folder for Render compatibility)
 UPLOADS_DIR = Path(__file__).parent / 'uploads'
 UPLOADS_DIR.mkdir(exist_ok=True)
-ALLOWED_EXTENSIONS = {'pdf', 'txt', 'md'}
+ALLOWED_SUFFIXES = frozenset({'.pdf', '.txt', '.md'})
+MAX_PDF_TEXT_CHARS = 200_000  # more than fits in the model's context; later pages are not read
+MAX_DOCUMENT_READERS = 4  # concurrent reads of the selected uploads for generations
+
+def _upload_index():
+    """Snapshot of the uploads directory as {filename: os.DirEntry}, from a single scandir."""
+    try:
+        with os.scandir(UPLOADS_DIR) as it:
+            return {entry.name: entry for entry in it if entry.is_file()}
+    except FileNotFoundError:
+        return {}
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return os.path.splitext(filename)[1].lower() in ALLOWED_SUFFIXES
 
 def extract_text_from_pdf(filepath):
     """Extract text from PDF file"""
     try:
-        text = ""
-        with open(filepath, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text()
-        return text
+        parts = []
+        total = 0
+        with fitz.open(filepath) as doc:
+            for page in doc:
+                page_text = page.get_text("text") or ""
+                parts.append(page_text)
+                total += len(page_text)
+                if total >= MAX_PDF_TEXT_CHARS:
+                    break
+        return "\n".join(parts)[:MAX_PDF_TEXT_CHARS]
     except Exception as e:
         logger.error(f"Error extracting PDF text: {str(e)}")
         return ""
 
-def extract_pdf_pages(filepath):
-    """Extract per-page text from PDF for citation-aware retrieval."""
+def _extract_pdf_pages_uncached(filepath):
     pages = []
     try:
-        with open(filepath, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for idx, page in enumerate(reader.pages, start=1):
-                page_text = page.extract_text() or ""
-                if page_text.strip():
-                    pages.append({
-                        "page": idx,
-                        "text": page_text.strip(),
-                    })
+        for idx, page_text in extract_page_texts(str(filepath)):
+            if page_text.strip():
+                pages.append({
+                    "page": idx,
+                    "text": page_text.strip(),
+                })
     except Exception as e:
         logger.error(f"Error extracting PDF pages from {filepath}: {str(e)}")
     return pages
 
-def read_file_content(filepath):
-    """Read content from uploaded file based on extension"""
+def _read_file_content_uncached(filepath):
     ext = filepath.suffix.lower()
     try:
         if ext == '.pdf':
@@ -85,6 +147,37 @@ def read_file_content(filepath):
         logger.error(f"Error reading file {filepath}: {str(e)}")
         return ""
 
+# Extraction results keyed by (path, mtime_ns, size): a re-uploaded file gets a new key
+@lru_cache(maxsize=128)
+def _extract_pdf_pages_cached(path_str, mtime_ns, size):
+    return _extract_pdf_pages_uncached(Path(path_str))
+
+@lru_cache(maxsize=128)
+def _read_file_content_cached(path_str, mtime_ns, size):
+    return _read_file_content_uncached(Path(path_str))
+
+def clear_document_caches():
+    _extract_pdf_pages_cached.cache_clear()
+    _read_file_content_cached.cache_clear()
+    _document_chunks.cache_clear()
+
+def extract_pdf_pages(filepath, st=None):
+    """Extract per-page text from PDF for citation-aware retrieval (cached; do not mutate the result)."""
+    try:
+        st = st or filepath.stat()
+    except OSError:
+        return []
+    return _extract_pdf_pages_cached(str(filepath), st.st_mtime_ns, st.st_size)
+
+def read_file_content(filepath, st=None):
+    """Read content from uploaded file based on extension (cached until the file changes)"""
+    try:
+        st = st or filepath.stat()
+    except OSError as e:
+        logger.error(f"Error reading file {filepath}: {str(e)}")
+        return ""
+    return _read_file_content_cached(str(filepath), st.st_mtime_ns, st.st_size)
+
 def _tokenize_for_retrieval(text):
     tokens = re.findall(r"[A-Za-z0-9]+", (text or "").lower())
     return {t for t in tokens if len(t) > 2}
@@ -139,7 +232,39 @@ def _best_snippet(text, answer_tokens, fallback_len=260):
             best = s
     return best[:fallback_len]
 
-def build_relevant_document_context(user_message, document_filenames, max_chunks=6):
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Long CPU-bound loops (chunking and scoring large uploads) pause every this many chunks:
+# under gevent, time.sleep(0) switches greenlets so other users' streams keep flowing
+CPU_YIELD_EVERY = 128
+
+@lru_cache(maxsize=128)
+def _document_chunks(path_str, mtime_ns, size):
+    """
+    Retrieval chunks for an upload with their term frequencies, computed once per
+    file version (keyed like the extraction caches). Do not mutate the result.
+    """
+    filepath = Path(path_str)
+    if filepath.suffix.lower() == ".pdf":
+        pages = [(p["page"], p["text"]) for p in _extract_pdf_pages_cached(path_str, mtime_ns, size)]
+    else:
+        pages = [(None, _read_file_content_cached(path_str, mtime_ns, size))]
+    chunks = []
+    for page, text in pages:
+        for chunk_text in _split_text_into_chunks(text, max_chars=900):
+            if len(chunks) % CPU_YIELD_EVERY == CPU_YIELD_EVERY - 1:
+                time.sleep(0)
+            terms = [t for t in re.findall(r"[A-Za-z0-9]+", chunk_text.lower()) if len(t) > 2]
+            chunks.append({
+                "page": page,
+                "text": chunk_text[:2200],
+                "tf": Counter(terms),
+                "length": len(terms),
+                "question_heavy": _is_question_heavy(chunk_text),
+            })
+    return tuple(chunks)
+
+def build_relevant_document_context(user_message, document_filenames, max_chunks=6, upload_index=None):
     """
     Build compact, citation-friendly document context from selected files.
     Returns:
@@ -150,41 +275,44 @@ def build_relevant_document_context(user_message, document_filenames, max_chunks
     if not document_filenames:
         return "", []
 
-    chunks = []
+    if upload_index is None:
+        upload_index = _upload_index()
+    candidates = []
     for filename in document_filenames:
-        filepath = UPLOADS_DIR / filename
-        if not filepath.exists() or not filepath.is_file():
+        entry = upload_index.get(filename)
+        if entry is None:
             continue
+        st = entry.stat()
+        for chunk in _document_chunks(entry.path, st.st_mtime_ns, st.st_size):
+            candidates.append((filename, chunk))
 
-        ext = filepath.suffix.lower()
-        if ext == ".pdf":
-            for page_data in extract_pdf_pages(filepath):
-                page_text = page_data["text"]
-                for chunk_text in _split_text_into_chunks(page_text, max_chars=900):
-                    page_tokens = _tokenize_for_retrieval(chunk_text)
-                    score = len(query_tokens & page_tokens) if query_tokens else 0
-                    # Strongly prefer content sections over question banks.
-                    if _is_question_heavy(chunk_text):
-                        score -= 2
-                    chunks.append({
-                        "filename": filename,
-                        "page": page_data["page"],
-                        "text": chunk_text[:2200],
-                        "score": score,
-                    })
-        else:
-            text = read_file_content(filepath)
-            if text:
-                for chunk_text in _split_text_into_chunks(text, max_chars=900):
-                    score = len(query_tokens & _tokenize_for_retrieval(chunk_text)) if query_tokens else 0
-                    if _is_question_heavy(chunk_text):
-                        score -= 2
-                    chunks.append({
-                        "filename": filename,
-                        "page": None,
-                        "text": chunk_text[:2200],
-                        "score": score,
-                    })
+    # Okapi BM25 over the candidate chunks, with the query's terms weighted by rarity across them
+    chunks = []
+    n = len(candidates)
+    avg_len = (sum(c["length"] for _, c in candidates) / n) if n else 0.0
+    idf = {}
+    for term in query_tokens:
+        df = sum(1 for _, c in candidates if term in c["tf"])
+        if df:
+            idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    for i, (filename, chunk) in enumerate(candidates, 1):
+        if i % CPU_YIELD_EVERY == 0:
+            time.sleep(0)
+        score = 0.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk["length"] / avg_len) if avg_len else BM25_K1
+        for term, weight in idf.items():
+            freq = chunk["tf"].get(term, 0)
+            if freq:
+                score += weight * freq * (BM25_K1 + 1) / (freq + norm)
+        # Strongly prefer content sections over question banks.
+        if chunk["question_heavy"]:
+            score = score * 0.5 if score > 0 else -1.0
+        chunks.append({
+            "filename": filename,
+            "page": chunk["page"],
+            "text": chunk["text"],
+            "score": score,
+        })
 
     if not chunks:
         return "", []
@@ -245,6 +373,15 @@ def health_check():
     return jsonify({'status': 'healthy', 'service': 'AI Learning Helper Backend'}), 200
 
 
+def _upload_stream_factory(total_content_length, content_type, filename, content_length=None):
+    """
+    Werkzeug stream factory: each uploaded part goes to a hidden temp file in UPLOADS_DIR.
+    Every file is recorded on g so upload_file can remove it even when parsing fails part-way.
+    """
+    temp_file = tempfile.NamedTemporaryFile('wb+', dir=UPLOADS_DIR, prefix='.upload-', delete=False)
+    g.setdefault('upload_temp_files', []).append(temp_file)
+    return temp_file
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """
@@ -253,54 +390,101 @@ def upload_file():
     Returns JSON: { "filename": str, "size": int, "type": str }
     """
     try:
-        if 'file' not in request.files:
+        # Multipart file parts are written straight into UPLOADS_DIR (no spool file + copy)
+        _, _, files = parse_form_data(
+            request.environ,
+            stream_factory=_upload_stream_factory,
+            max_content_length=app.config['MAX_CONTENT_LENGTH'],
+        )
+        if 'file' not in files:
             return jsonify({'error': 'No file provided'}), 400
         
-        file = request.files['file']
+        file = files['file']
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
         if not allowed_file(file.filename):
             return jsonify({'error': 'File type not allowed. Only PDF, TXT, and MD files are supported'}), 400
         
-        # Save file
-        filepath = UPLOADS_DIR / file.filename
-        file.save(filepath)
+        # The client-supplied name may contain "../" or a path; keep only a safe base name
+        filename = secure_filename(file.filename)
+        if not filename or not allowed_file(filename):
+            return jsonify({'error': 'Invalid filename'}), 400
         
-        file_size = os.path.getsize(filepath)
-        file_type = Path(file.filename).suffix[1:].upper()
+        # Move the streamed temp file into place; its size is the end offset (no stat of the new path)
+        filepath = UPLOADS_DIR / filename
+        temp_path = file.stream.name
+        file_size = file.stream.seek(0, os.SEEK_END)
+        file.stream.close()
+        os.replace(temp_path, filepath)
         
-        logger.info(f"File uploaded: {file.filename} ({file_size} bytes)")
+        file_type = Path(filename).suffix[1:].upper()
+        
+        logger.info(f"File uploaded: {filename} ({file_size} bytes)")
         
         return jsonify({
-            'filename': file.filename,
+            'filename': filename,
             'size': file_size,
             'type': file_type
         }), 200
         
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'File too large'}), 413
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+    finally:
+        # Remove temp files for parts that were rejected, not moved into place, or left
+        # behind by a disconnect, malformed multipart body or mid-parse 413
+        for temp_file in g.pop('upload_temp_files', []):
+            temp_file.close()
+            try:
+                os.unlink(temp_file.name)
+            except OSError:
+                pass
 
 
 @app.route('/api/uploads', methods=['GET'])
 def list_uploads():
     """
-    List all uploaded files.
-    Returns JSON: { "files": [{"filename": str, "size": int, "type": str}, ...] }
+    List uploaded files, sorted by filename, optionally a page at a time.
+    Query: limit (optional, max 1000; all files when omitted), offset (default 0).
+    Returns JSON: { "files": [{"filename": str, "size": int, "type": str}, ...], "next_offset": int | null }
+    The ETag follows the uploads directory's mtime, so unchanged listings return 304.
     """
     try:
-        files = []
-        if UPLOADS_DIR.exists():
-            for filepath in UPLOADS_DIR.iterdir():
-                if filepath.is_file() and allowed_file(filepath.name):
-                    files.append({
-                        'filename': filepath.name,
-                        'size': filepath.stat().st_size,
-                        'type': filepath.suffix[1:].upper()
-                    })
-        
-        return jsonify({'files': files}), 200
+        try:
+            limit = request.args.get('limit')
+            limit = min(max(int(limit), 1), 1000) if limit is not None else None
+            offset = max(int(request.args.get('offset', 0)), 0)
+        except ValueError:
+            return jsonify({'error': 'limit and offset must be integers'}), 400
+        
+        try:
+            dir_mtime = UPLOADS_DIR.stat().st_mtime_ns
+        except FileNotFoundError:
+            return jsonify({'files': [], 'next_offset': None}), 200
+        etag = f"{dir_mtime}-{offset}-{limit or 'all'}"
+        # Flask-Compress sends the ETag back with a ":gzip"/":br" suffix; compare without it
+        if any(tag.split(':', 1)[0] == etag for tag in request.if_none_match):
+            return '', 304, {'ETag': f'"{etag}"'}
+        
+        with os.scandir(UPLOADS_DIR) as it:
+            entries = sorted(
+                (entry for entry in it if entry.is_file() and allowed_file(entry.name)),
+                key=lambda entry: entry.name,
+            )
+        end = len(entries) if limit is None else offset + limit
+        next_offset = end if end < len(entries) else None
+        files = [{
+            'filename': entry.name,
+            'size': entry.stat().st_size,
+            'type': os.path.splitext(entry.name)[1][1:].upper()
+        } for entry in entries[offset:end]]
+        
+        resp = jsonify({'files': files, 'next_offset': next_offset})
+        resp.set_etag(etag)
+        return resp, 200
         
     except Exception as e:
         logger.error(f"Error listing uploads: {str(e)}")
@@ -318,7 +502,8 @@ def get_upload(filename):
         if not filepath.exists() or not filepath.is_file():
             return jsonify({'error': 'File not found'}), 404
 
-        return send_from_directory(UPLOADS_DIR, safe_name, as_attachment=False)
+        return send_from_directory(UPLOADS_DIR, safe_name, as_attachment=False,
+                                   conditional=True, etag=True)
     except Exception as e:
         logger.error(f"Error serving uploaded file {filename}: {str(e)}")
         return jsonify({'error': f'Failed to serve file: {str(e)}'}), 500
@@ -344,6 +529,7 @@ def delete_upload(filename):
             return jsonify({'error': 'Not a file'}), 400
         
         filepath.unlink()  # Delete the file
+        clear_document_caches()
         logger.info(f"File deleted: {filename}")
         
         return jsonify({'status': 'success', 'filename': filename}), 200
@@ -370,74 +556,10 @@ def user_ensure():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
-    """
-    Handle chat requests from the frontend.
-    Expects JSON: {
-        "message": "user message",
-        "course_name": "course name",
-        "conversation_history": [{"role": "user|assistant", "content": "..."}],
-        "document_filenames": ["file1.pdf", "file2.txt"],
-        "user_identifier": "email or id for personalization (optional)",
-        "use_memory": true to use saved history, mistakes, repeated-Q detection (optional, default true)
-    }
-    Returns JSON: { "response": "AI response", "status": "success", "similar_question": {...} if detected }
-    """
-    try:
-        data = request.get_json()
-        
-        if not data or 'message' not in data:
-            return jsonify({'error': 'Missing message in request'}), 400
-        
-        user_message = data['message']
-        course_name = data.get('course_name', 'your course')
-        conversation_history = list(data.get('conversation_history', []))
-        document_filenames = data.get('document_filenames', [])
-        user_identifier = (data.get('user_identifier') or '').strip()
-        use_memory = data.get('use_memory', True)
-        
-        user_id = None
-        if user_identifier:
-            try:
-                user_id = get_or_create_user(user_identifier)
-            except ValueError:
-                pass
-        
-        logger.info(f"Received chat request for course: {course_name}, use_memory=%s", use_memory)
-        logger.info(f"User message: {user_message}")
-        logger.info(f"Conversation history length: {len(conversation_history)}")
-        logger.info(f"Documents requested: {document_filenames}")
-        
-        # When use_memory and we have user_id, merge in persisted history and add personalization context
-        similar_info = None
-        mistakes_context = ""
-        if use_memory and user_id:
-            # Prefer recent DB history for consistency (last 20 turns)
-            db_history = get_recent_chat_history(user_id, course_name, limit=20)
-            if db_history:
-                # Current user message must be last (LLM client does not append it when history is provided)
-                conversation_history = db_history + [{"role": "user", "content": user_message}]
-            # else: keep frontend-sent conversation_history (it already includes the new message)
-            # Detect repeated/similar question and surface for the model
-            similar_info = find_similar_past_question(user_id, course_name, user_message)
-            # Load mistakes for this course to address weak areas
-            mistakes = get_mistakes(user_id, course=course_name)
-            if mistakes:
-                mistakes_context = "\n".join(
-                    f"- Topic: {m.get('topic') or 'General'}; Question: {m['question'][:200]}; Correction/note: {m.get('correction', '')[:200]}"
-                    for m in mistakes[:15]
-                )
-        
-        # Build citation-aware document context for this question
-        document_context, selected_doc_chunks = build_relevant_document_context(
-            user_message=user_message,
-            document_filenames=document_filenames,
-            max_chunks=6,
-        )
-        
-        # Build context-aware system prompt
-        system_prompt = f"""You are an AI Socratic tutor helping students learn {course_name}.
+# System prompt templates (formatted once per course, not rebuilt on every request)
+# Course-independent so every request shares the same long prefix, which Azure OpenAI prompt caching
+# reuses across requests; the course and per-student sections are appended after it
+CHAT_SYSTEM_PROMPT = """You are an AI Socratic tutor helping students learn the course given on the COURSE line that follows these instructions.
 
 Your goal is to guide the student’s thinking without ever revealing the solution to their specific problem.
 
@@ -597,29 +719,30 @@ Before sending a response, verify:
 
 Only output responses that follow the Socratic tutoring format.
 """
-        
-        # Add repeated-question / misunderstanding guidance
-        if similar_info:
-            system_prompt += f"""
 
-REPEATED OR SIMILAR QUESTION: The student has asked something similar before: "{similar_info.get('question', '')[:300]}". 
+
+COURSE_FRAGMENT = """
+
+COURSE: {course_name}
+"""
+
+# Optional system prompt sections, appended in this order after the course
+SIMILAR_QUESTION_FRAGMENT = """
+
+REPEATED OR SIMILAR QUESTION: The student has asked something similar before: "{question}". 
 Address any root misunderstanding; reference the reference materials (if provided) to reinforce the concept. Do not simply repeat the same explanation—probe for what is still unclear and build deeper understanding.
 """
-        
-        # Add mistakes/weak areas context
-        if mistakes_context:
-            system_prompt += f"""
+
+MISTAKES_FRAGMENT = """
 
 AREAS THE STUDENT HAS STRUGGLED WITH (use to tailor explanations and avoid repeating the same confusions):
-{mistakes_context}
+{mistakes}
 """
-        
-        # Add document context to system prompt if available
-        if document_context:
-            system_prompt += f"""
+
+DOCUMENTS_FRAGMENT = """
 
 REFERENCE MATERIALS PROVIDED BY STUDENT:
-{document_context}
+{documents}
 
 Use the above reference materials to provide context-aware answers. You can reference specific materials from the documents when helping the student. When the student asks repeated or related questions, bring in relevant excerpts from these materials to deepen learning.
 When you reference material from a source, include short inline citations in this format:
@@ -627,87 +750,455 @@ When you reference material from a source, include short inline citations in thi
 If page number is not available, cite as:
 [source: filename]
 """
-        
-        # Get available tools
-        tools = get_available_tools()
-        
-        # Initial LLM call with tools and conversation history
-        response = llm_client.get_completion(
+
+
+@lru_cache(maxsize=64)
+def _get_chat_system_prompt(course_name):
+    return CHAT_SYSTEM_PROMPT + COURSE_FRAGMENT.format(course_name=course_name)
+
+
+# Pleasantries answered locally without an LLM call (normalized: lowercase, no trailing punctuation)
+_GREETING_REPLY = "Hi! What are you working on today? Share a problem or a concept you're stuck on and we'll work through it together."
+_THANKS_REPLY = "You're welcome! What would you like to work on next?"
+CANNED_REPLIES = {
+    'hi': _GREETING_REPLY,
+    'hello': _GREETING_REPLY,
+    'hey': _GREETING_REPLY,
+    'thanks': _THANKS_REPLY,
+    'thank you': _THANKS_REPLY,
+    'thx': _THANKS_REPLY,
+    'ok': "Great! Do you have another question, or would you like to try a practice problem?",
+    'okay': "Great! Do you have another question, or would you like to try a practice problem?",
+}
+EMPTY_MESSAGE_REPLY = "It looks like your message was empty. What question or concept would you like help with?"
+
+
+def _canned_reply(user_message):
+    """Reply for empty messages and simple pleasantries, or None if the LLM is needed."""
+    if not isinstance(user_message, str):
+        return None
+    normalized = user_message.strip().lower().rstrip('!.?')
+    if not normalized:
+        return EMPTY_MESSAGE_REPLY
+    return CANNED_REPLIES.get(normalized)
+
+
+def _chat_body_too_large():
+    return (request.content_length or 0) > MAX_CHAT_BODY_BYTES
+
+
+def _cap_history(conversation_history):
+    """Keep the most recent turns within MAX_HISTORY_TURNS and MAX_HISTORY_CHARS, dropping the oldest first."""
+    history = [m for m in conversation_history[-MAX_HISTORY_TURNS:] if isinstance(m, dict)]
+    total = sum(len(str(m.get('content') or '')) for m in history)
+    while len(history) > 1 and total > MAX_HISTORY_CHARS:
+        total -= len(str(history.pop(0).get('content') or ''))
+    return history
+
+
+def _parse_json_body():
+    """Parse the request body with orjson; None if it is missing or not valid JSON."""
+    try:
+        return orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        return None
+
+
+def _get_session_id(data):
+    """
+    Session id from the request body or HttpOnly cookie; a new one is issued if absent.
+    An explicit "session_id": null (e.g. after a course switch) starts a new session
+    rather than falling back to the cookie.
+    """
+    if 'session_id' in data:
+        session_id = data['session_id']
+    else:
+        session_id = request.cookies.get('session_id')
+    if not isinstance(session_id, str) or not session_id.strip():
+        return session_store.new_session_id()
+    return session_id.strip()[:64]
+
+
+def _with_session_cookie(response, session_id):
+    response.set_cookie('session_id', session_id, max_age=SESSION_TTL, httponly=True, samesite='Lax')
+    return response
+
+
+@lru_cache(maxsize=1024)
+def _render_mistakes(user_id, course_name, version):
+    """Prompt lines for a user's mistakes in a course; re-rendered only when version (count, max id) changes."""
+    mistakes = get_mistakes(user_id, course=course_name)
+    return "\n".join(
+        f"- Topic: {m.get('topic') or 'General'}; Question: {m['question'][:200]}; Correction/note: {m.get('correction', '')[:200]}"
+        for m in mistakes[:15]
+    )
+
+
+def _chat_user_id(data):
+    """User id for the request's user_identifier, or None when it is missing or invalid."""
+    user_identifier = (data.get('user_identifier') or '').strip()
+    if not user_identifier:
+        return None
+    try:
+        return get_or_create_user(user_identifier)
+    except ValueError:
+        return None
+
+
+def _canned_chat_turn(data, session_id):
+    """
+    Response payload for an empty message or an opening pleasantry, or None if the LLM is needed.
+    A short acknowledgement mid-conversation ("ok" after the tutor asked a question) is an
+    answer, so pleasantries are only canned when there is no prior history; those turns are
+    persisted like any other. Empty messages are answered without being stored.
+    """
+    user_message = data['message']
+    canned = _canned_reply(user_message)
+    if canned is None:
+        return None
+    if canned is EMPTY_MESSAGE_REPLY:
+        return {'response': canned, 'status': 'success'}
+    
+    course_name = data.get('course_name', 'your course')
+    if len(data.get('conversation_history') or []) > 1 or session_store.get_history(session_id, course_name):
+        return None
+    use_memory = data.get('use_memory', True)
+    user_id = _chat_user_id(data)
+    if use_memory and user_id and get_recent_chat_history(user_id, course_name, limit=1):
+        return None
+    
+    ctx = {
+        'session_id': session_id,
+        'user_message': user_message,
+        'course_name': course_name,
+        'user_id': user_id,
+        'use_memory': use_memory,
+        'similar_info': None,
+        'selected_doc_chunks': [],
+    }
+    return _finish_chat_turn(ctx, canned)
+
+
+def _build_chat_context(data, session_id):
+    """
+    Assemble everything a chat completion needs from the request body: history
+    (server-side session, merged with saved memory), personalization and document
+    context, and the final system prompt. Shared by /api/chat and /api/chat/stream.
+    """
+    user_message = data['message']
+    course_name = data.get('course_name', 'your course')
+    conversation_history = list(data.get('conversation_history') or [])
+    if not conversation_history:
+        # Client sent only the new message: continue the server-side session history
+        conversation_history = session_store.get_history(session_id, course_name) + [{"role": "user", "content": user_message}]
+    document_filenames = data.get('document_filenames', [])
+    use_memory = data.get('use_memory', True)
+    user_id = _chat_user_id(data)
+    
+    logger.debug("Received chat request for course: %s, use_memory=%s", course_name, use_memory)
+    logger.debug("User message: %s", user_message)
+    logger.debug("Conversation history length: %d", len(conversation_history))
+    logger.debug("Documents requested: %s", document_filenames)
+    
+    # Document retrieval, the memory lookups and the semantic-cache embedding are
+    # independent: run them concurrently so the slowest one bounds the wait
+    similar_info = None
+    mistakes_context = ""
+    semantic_vector = None
+    load_memory = bool(use_memory and user_id)
+    embed_prompt = semantic_cache.enabled and len(conversation_history) <= 1
+    upload_index = _upload_index() if document_filenames else {}
+    with ThreadPoolExecutor(max_workers=(4 if load_memory else 1) + embed_prompt) as executor:
+        if embed_prompt:
+            embed_future = executor.submit(semantic_cache.embed, user_message)
+        # Build citation-aware document context for this question
+        doc_future = executor.submit(
+            build_relevant_document_context,
             user_message=user_message,
-            system_prompt=system_prompt,
-            tools=tools,
-            conversation_history=conversation_history
+            document_filenames=document_filenames,
+            max_chunks=6,
+            upload_index=upload_index,
         )
+        if load_memory:
+            # Prefer recent DB history for consistency (last 20 turns)
+            history_future = executor.submit(get_recent_chat_history, user_id, course_name, limit=20)
+            # Detect repeated/similar question and surface for the model
+            similar_future = executor.submit(find_similar_past_question, user_id, course_name, user_message)
+            # Mistakes for this course address weak areas; only their version is read per turn
+            mistakes_future = executor.submit(get_mistakes_version, user_id, course=course_name)
         
-        logger.info(f"Initial response finish_reason: {response['finish_reason']}")
-        
-        # Check if LLM wants to call a tool
-        if response['tool_calls']:
-            logger.info(f"LLM requested {len(response['tool_calls'])} tool call(s)")
-            
-            # Build conversation history
-            messages = [
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_message},
-                {'role': 'assistant', 'content': response.get('content'), 'tool_calls': response['tool_calls']}
-            ]
-            
-            # Execute each tool call
-            for tool_call in response['tool_calls']:
-                function_name = tool_call['function']['name']
-                function_args = json.loads(tool_call['function']['arguments'])
-                
-                logger.info(f"Executing tool: {function_name} with args: {function_args}")
-                
-                if function_name == 'solve_math_problem':
-                    tool_result = execute_wolfram_tool(function_args['problem'])
-                    
-                    # Add tool result to conversation
-                    messages.append({
-                        'role': 'tool',
-                        'tool_call_id': tool_call['id'],
-                        'name': function_name,
-                        'content': json.dumps(tool_result)
-                    })
-            
-            # Get final response from LLM with tool results
-            final_response = llm_client.get_completion_with_tool_result(
-                messages=messages,
-                tools=tools
-            )
-            
-            ai_response = final_response['content']
-            logger.info("Generated AI response with tool results")
-        else:
-            # No tool calls needed, use direct response
-            ai_response = response['content']
-            logger.info("Generated AI response without tools")
+            db_history = history_future.result()
+            if db_history:
+                # Current user message must be last (LLM client does not append it when history is provided)
+                conversation_history = db_history + [{"role": "user", "content": user_message}]
+            # else: keep frontend-sent conversation_history (it already includes the new message)
+            similar_info = similar_future.result()
+            mistakes_context = _render_mistakes(user_id, course_name, mistakes_future.result())
+        document_context, selected_doc_chunks = doc_future.result()
+        if embed_prompt:
+            semantic_vector = embed_future.result()
+    
+    conversation_history = _cap_history(conversation_history)
+    
+    # Build context-aware system prompt: static template plus the optional sections
+    prompt_parts = [_get_chat_system_prompt(course_name)]
+    if similar_info:
+        prompt_parts.append(SIMILAR_QUESTION_FRAGMENT.format(question=similar_info.get('question', '')[:300]))
+    if mistakes_context:
+        prompt_parts.append(MISTAKES_FRAGMENT.format(mistakes=mistakes_context))
+    if document_context:
+        prompt_parts.append(DOCUMENTS_FRAGMENT.format(documents=document_context))
+    system_prompt = "".join(prompt_parts)
+    
+    return {
+        'session_id': session_id,
+        'user_message': user_message,
+        'course_name': course_name,
+        'conversation_history': conversation_history,
+        'document_filenames': document_filenames,
+        'upload_index': upload_index,
+        'user_id': user_id,
+        'use_memory': use_memory,
+        'similar_info': similar_info,
+        'selected_doc_chunks': selected_doc_chunks,
+        'semantic_vector': semantic_vector,
+        'system_prompt': system_prompt,
+    }
+
+
+def _documents_fingerprint(document_filenames, upload_index):
+    """Hash of the selected uploads' names, sizes and mtimes; changes whenever a document does."""
+    parts = []
+    for filename in sorted(document_filenames or []):
+        entry = upload_index.get(filename)
+        if entry is None:
+            continue
+        st = entry.stat()
+        parts.append(f"{filename}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()[:16] if parts else ""
+
+
+def _semantic_scope(ctx):
+    """Semantic cache partition: answers are only reused for the same course, user and documents."""
+    return f"{ctx['course_name']}|user:{ctx['user_id'] or ''}|docs:{_documents_fingerprint(ctx['document_filenames'], ctx['upload_index'])}"
+
+
+def _lookup_cached_response(ctx):
+    """
+    Check the exact-match cache, then the semantic cache for paraphrased questions.
+    Returns (cached_response or None, cache_key, semantic_vector).
+    """
+    # Identical request (same prompt, history and tools) -> reuse the cached answer
+    cache_key = response_cache.cache_key(
+        ctx['user_message'], ctx['course_name'], ctx['conversation_history'], TOOLS,
+        system_prompt=ctx['system_prompt'],
+    )
+    cached_response = response_cache.get(cache_key)
+    
+    # Paraphrased first questions -> semantic cache (only for stateless turns)
+    semantic_vector = None
+    if (cached_response is None and semantic_cache.enabled
+            and len(ctx['conversation_history']) <= 1):
+        # Usually embedded already while the context was loading
+        semantic_vector = ctx['semantic_vector']
+        if semantic_vector is None:
+            semantic_vector = semantic_cache.embed(ctx['user_message'])
+        cached_response = semantic_cache.lookup(_semantic_scope(ctx), semantic_vector, ctx['user_message'])
+    return cached_response, cache_key, semantic_vector
+
+
+def _store_cached_response(ctx, cache_key, semantic_vector, ai_response, finish_reason, used_tools):
+    # Never cache error fallbacks; the next identical request should retry the LLM
+    if not ai_response or finish_reason == 'error':
+        return
+    response_cache.set(cache_key, ai_response, ttl=3600)
+    if not used_tools:
+        semantic_cache.add(_semantic_scope(ctx), ctx['user_message'], ai_response, semantic_vector)
+
+
+def _run_tool_calls(tool_calls):
+    """
+    Execute the tool calls requested by the LLM and return the resulting 'tool'
+    messages in request order. Calls run concurrently (each is a blocking HTTP
+    request), so N tool calls cost about one Wolfram round-trip instead of N.
+    """
+    pending = []
+    for tool_call in tool_calls:
+        function_name = tool_call['function']['name']
+        function_args = orjson.loads(tool_call['function']['arguments'])
         
-        logger.info(f"AI Response text (first 500 chars): {ai_response[:500]}")
+        logger.debug("Executing tool: %s with args: %s", function_name, function_args)
         
-        # Persist this turn when we have a user identity and memory is enabled
-        if user_id and use_memory:
-            try:
-                save_chat_turn(user_id, course_name, 'user', user_message)
-                save_chat_turn(user_id, course_name, 'assistant', ai_response)
-            except Exception as e:
-                logger.warning("Failed to save chat history: %s", e)
+        handler = TOOL_DISPATCH.get(function_name)
+        if handler is None:
+            logger.warning("Unknown tool requested: %s", function_name)
+            continue
+        pending.append((tool_call, function_name, handler, function_args))
+    
+    if len(pending) > 1:
+        with ThreadPoolExecutor(max_workers=min(MAX_TOOL_WORKERS, len(pending))) as executor:
+            results = list(executor.map(lambda p: p[2](p[3]), pending))
+    else:
+        results = [handler(args) for _, _, handler, args in pending]
+    
+    # Add tool results to conversation
+    return [
+        {
+            'role': 'tool',
+            'tool_call_id': tool_call['id'],
+            'name': function_name,
+            'content': orjson.dumps(tool_result).decode()
+        }
+        for (tool_call, function_name, _, _), tool_result in zip(pending, results)
+    ]
+
+
+def _tool_followup_messages(system_prompt, user_message, assistant_content, tool_calls):
+    """Build the conversation sent back to the LLM once the requested tools have run."""
+    messages = [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': user_message},
+        {'role': 'assistant', 'content': assistant_content, 'tool_calls': tool_calls}
+    ]
+    messages.extend(_run_tool_calls(tool_calls))
+    return messages
+
+
+def _complete_chat(user_message, system_prompt, tools, conversation_history):
+    """
+    Run the chat completion, including any tool calls.
+    Returns (ai_response, finish_reason, used_tools).
+    """
+    response = llm_client.get_completion(
+        user_message=user_message,
+        system_prompt=system_prompt,
+        tools=tools,
+        conversation_history=conversation_history
+    )
+    
+    logger.debug("Initial response finish_reason: %s", response['finish_reason'])
+    
+    # Check if LLM wants to call a tool
+    if response['tool_calls']:
+        logger.debug("LLM requested %d tool call(s)", len(response['tool_calls']))
         
-        out = {'response': ai_response, 'status': 'success'}
-        citations = select_citations_for_answer(
-            selected_doc_chunks,
-            user_message=user_message,
-            ai_response=ai_response,
-            max_citations=1,
+        messages = _tool_followup_messages(
+            system_prompt, user_message, response.get('content'), response['tool_calls']
         )
-        if citations:
-            out['citations'] = citations
-        if similar_info:
-            out['similar_question'] = similar_info
-        return jsonify(out), 200
         
+        # Get final response from LLM with tool results
+        final_response = llm_client.get_completion_with_tool_result(
+            messages=messages,
+            tools=tools
+        )
+        
+        ai_response = final_response['content']
+        finish_reason = final_response['finish_reason']
+        logger.debug("Generated AI response with tool results")
+    else:
+        # No tool calls needed, use direct response
+        ai_response = response['content']
+        finish_reason = response['finish_reason']
+        logger.debug("Generated AI response without tools")
+    
+    return ai_response, finish_reason, bool(response['tool_calls'])
+
+
+def _save_chat_turns(user_id, course_name, user_message, ai_response):
+    try:
+        save_chat_turn(user_id, course_name, 'user', user_message)
+        save_chat_turn(user_id, course_name, 'assistant', ai_response)
     except Exception as e:
-        logger.error(f"Error processing chat request: {str(e)}")
+        logger.warning("Failed to save chat history: %s", e)
+
+
+def _finish_chat_turn(ctx, ai_response):
+    """Persist the turn (session, and DB when memory is enabled) and build the response payload."""
+    user_id = ctx['user_id']
+    course_name = ctx['course_name']
+    user_message = ctx['user_message']
+    
+    session_store.append_turn(ctx['session_id'], course_name, user_message, ai_response)
+    
+    # Persist this turn when we have a user identity and memory is enabled (queued, written off the request path)
+    if user_id and ctx['use_memory']:
+        _save_chat_turns(user_id, course_name, user_message, ai_response)
+    
+    out = {'response': ai_response, 'status': 'success', 'session_id': ctx['session_id']}
+    citations = select_citations_for_answer(
+        ctx['selected_doc_chunks'],
+        user_message=user_message,
+        ai_response=ai_response,
+        max_citations=1,
+    )
+    if citations:
+        out['citations'] = citations
+    if ctx['similar_info']:
+        out['similar_question'] = ctx['similar_info']
+    return out
+
+
+@app.after_request
+def _mark_blocking_chat_deprecated(response):
+    if request.path == '/api/chat':
+        response.headers['Deprecation'] = 'true'
+        response.headers['Link'] = '</api/chat/stream>; rel="successor-version"'
+    return response
+
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    """
+    Handle chat requests with a single blocking JSON response.
+    Deprecated in favour of /api/chat/stream (same body, tokens streamed as generated);
+    responses carry Deprecation and Link headers pointing at it.
+    Expects JSON: {
+        "message": "user message",
+        "course_name": "course name",
+        "session_id": "id from a previous response (optional; also read from the session_id cookie)",
+        "conversation_history": [{"role": "user|assistant", "content": "..."}] (optional; defaults to the server-side session history),
+        "document_filenames": ["file1.pdf", "file2.txt"],
+        "user_identifier": "email or id for personalization (optional)",
+        "use_memory": true to use saved history, mistakes, repeated-Q detection (optional, default true)
+    }
+    Returns JSON: { "response": "AI response", "status": "success", "session_id": str, "similar_question": {...} if detected }
+    """
+    try:
+        if _chat_body_too_large():
+            return jsonify({'error': 'Request body too large'}), 413
+        data = _parse_json_body()
+        
+        if not isinstance(data, dict) or 'message' not in data:
+            return jsonify({'error': 'Missing message in request'}), 400
+        
+        session_id = _get_session_id(data)
+        canned = _canned_chat_turn(data, session_id)
+        if canned is not None:
+            return _with_session_cookie(jsonify(canned), session_id), 200
+        
+        ctx = _build_chat_context(data, session_id)
+        cached_response, cache_key, semantic_vector = _lookup_cached_response(ctx)
+        
+        if cached_response is not None:
+            ai_response = cached_response
+            logger.debug("Serving AI response from cache")
+        else:
+            ai_response, finish_reason, used_tools = llm_coalescer.run(
+                cache_key, _complete_chat,
+                ctx['user_message'], ctx['system_prompt'], TOOLS, ctx['conversation_history'],
+            )
+            _store_cached_response(ctx, cache_key, semantic_vector, ai_response, finish_reason, used_tools)
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("AI Response text (first 500 chars): %s", ai_response[:500])
+        
+        out = _finish_chat_turn(ctx, ai_response)
+        resp = jsonify(out)
+        resp.headers['X-Cache'] = 'HIT' if cached_response is not None else 'MISS'
+        return _with_session_cookie(resp, ctx['session_id']), 200
+        
+    except Exception as e:
+        logger.error("Error processing chat request: %s", e)
         return jsonify({
             'error': 'Failed to process chat request',
             'details': str(e)
@@ -805,30 +1296,79 @@ def save_study_plan_route():
         return jsonify({'error': str(e)}), 500
 
 
-def _generate_with_llm(prompt: str, document_context: str = "", course_name: str = "your course") -> str:
-    """Helper to get a one-shot completion for study guide / practice exam / weekly review."""
+def _load_document_context(document_filenames):
+    """Read the selected uploads concurrently and format them as '--- filename ---' sections."""
+    upload_index = _upload_index() if document_filenames else {}
+    selected = [(filename, upload_index[filename]) for filename in document_filenames if filename in upload_index]
+    
+    def read(entry):
+        return read_file_content(Path(entry.path), entry.stat())
+    
+    if len(selected) > 1:
+        with ThreadPoolExecutor(max_workers=min(MAX_DOCUMENT_READERS, len(selected))) as executor:
+            contents = list(executor.map(read, [entry for _, entry in selected]))
+    else:
+        contents = [read(entry) for _, entry in selected]
+    return "".join(
+        f"\n--- {filename} ---\n{content}\n" for (filename, _), content in zip(selected, contents) if content
+    )
+
+
+def _generator_system_prompt(course_name, document_context=""):
     system = f"""You are an educational assistant for {course_name}. 
 Generate clear, structured content. Be concise but pedagogically helpful. 
 Focus on understanding and critical thinking, not just facts."""
     if document_context:
         system += f"\n\nReference materials the student has provided:\n{document_context}"
+    return system
+
+
+# Completion token cap of the Azure deployment; one-shot generations never ask for more
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', '4096'))
+
+
+def _generate_uncached(cache_key: str, prompt: str, system: str) -> str:
+    r = llm_client.get_completion(
+        user_message=prompt,
+        system_prompt=system,
+        conversation_history=[],
+        temperature=0.6,
+        max_tokens=min(4000, LLM_MAX_OUTPUT_TOKENS),
+    )
+    text = (r.get('content') or '').strip()
+    if text and r.get('finish_reason') != 'error':
+        response_cache.set(cache_key, text, ttl=3600)
+    return text
+
+
+def _generate_with_llm(prompt: str, document_context: str = "", course_name: str = "your course",
+                       regenerate: bool = False) -> str:
+    """
+    Helper to get a one-shot completion for study guide / practice exam / weekly review.
+    regenerate=True (the user asked again) skips the cache and asks the model for a fresh
+    result, which then replaces the cached one.
+    """
+    system = _generator_system_prompt(course_name, document_context)
+    # Same prompt, course and documents -> reuse the exact-match cached generation
+    cache_key = response_cache.cache_key(prompt, course_name, [], None, system_prompt=system)
     try:
-        r = llm_client.get_completion(
-            user_message=prompt,
-            system_prompt=system,
-            conversation_history=[],
-            temperature=0.6,
-            max_tokens=4000,
-        )
-        return (r.get('content') or '').strip()
+        if regenerate:
+            return _generate_uncached(cache_key, prompt, system)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        return llm_coalescer.run(cache_key, _generate_uncached, cache_key, prompt, system)
     except Exception as e:
         logger.error("LLM generation failed: %s", e)
         return f"Generation failed: {e}"
 
 
+NUMBERED_LINE_RE = re.compile(r'^\s*\d+[.)]\s+(.+?)\s*$', re.MULTILINE)
+
+
 @app.route('/api/weekly-review', methods=['POST'])
 def weekly_review():
-    """Generate weekly review prompts based on weak areas (mistakes). Body: user_identifier, course (optional)."""
+    """Generate weekly review prompts based on weak areas (mistakes). Body: user_identifier, course (optional), regenerate (optional)."""
     try:
         data = request.get_json() or {}
         identifier = (data.get('user_identifier') or '').strip()
@@ -850,41 +1390,135 @@ def weekly_review():
 
 Student's weak areas:
 {summary}"""
-        text = _generate_with_llm(prompt, course_name=course or "the course")
-        # Simple split into list of prompts
-        lines = [s.strip() for s in text.split('\n') if s.strip() and s.strip()[0].isdigit()]
-        if not lines:
-            lines = [text]
+        text = _generate_with_llm(prompt, course_name=course or "the course", regenerate=bool(data.get('regenerate')))
+        # Numbered items ("1." or "1)") without their numbers; the panel renders its own list numbering
+        lines = NUMBERED_LINE_RE.findall(text) or [text]
         return jsonify({'review_prompts': lines, 'full_text': text}), 200
     except Exception as e:
         logger.error(str(e))
         return jsonify({'error': str(e)}), 500
 
 
+def _generate_study_guide(course_name, topic, document_context="", regenerate=False):
+    scope = f" for the topic: {topic}" if topic else ""
+    prompt = f"""Create a concise study guide for {course_name}{scope}. Include key concepts, definitions, and short practice suggestions. Structure with clear headings. Aim for understanding and critical thinking, not just memorization. Use $...$ for inline math and $$...$$ for display math (limits, fractions, equations)."""
+    return _generate_with_llm(prompt, document_context=document_context, course_name=course_name, regenerate=regenerate)
+
+
+def _generate_practice_exam(course_name, topic, document_context="", regenerate=True):
+    scope = f" focused on: {topic}" if topic else ""
+    prompt = f"""Generate a short practice exam (5-8 questions) for {course_name}{scope}. Mix question types: conceptual, short answer, and application. Base questions on the course material; if reference materials are provided below, use them. Do not give answers—only the questions. Format as a numbered list with clear questions. Use $...$ for inline math (e.g. $f(x)$, $x \\\\to 2$) and $$...$$ for display equations (e.g. limits, fractions on their own line)."""
+    if document_context:
+        prompt += f"\n\nReference materials:\n{document_context}"
+    # Fresh by default: clicking Generate again should produce a different exam
+    return _generate_with_llm(prompt, document_context="", course_name=course_name, regenerate=regenerate)
+
+
+# kind -> (generator, response field) for /api/generate-batch
+GENERATORS = {
+    'study_guide': (_generate_study_guide, 'study_guide'),
+    'practice_exam': (_generate_practice_exam, 'practice_exam'),
+}
+MAX_BATCH_ITEMS = 10
+LLM_BATCH_CONCURRENCY = int(os.getenv('LLM_BATCH_CONCURRENCY', '8'))  # keep within the deployment's RPM limit
+
+
 @app.route('/api/generate-study-guide', methods=['POST'])
 def generate_study_guide():
-    """Generate a study guide from course/topic and optional documents. Body: user_identifier, course_name, topic (optional), document_filenames (optional)."""
+    """Generate a study guide from course/topic and optional documents. Body: user_identifier, course_name, topic (optional), document_filenames (optional), regenerate (optional)."""
     try:
         data = request.get_json() or {}
         course_name = (data.get('course_name') or 'your course').strip()
         topic = (data.get('topic') or '').strip()
         document_filenames = data.get('document_filenames') or []
-        document_context = ""
-        for filename in document_filenames:
-            filepath = UPLOADS_DIR / filename
-            if filepath.exists():
-                content = read_file_content(filepath)
-                if content:
-                    document_context += f"\n--- {filename} ---\n{content}\n"
-        scope = f" for the topic: {topic}" if topic else ""
-        prompt = f"""Create a concise study guide for {course_name}{scope}. Include key concepts, definitions, and short practice suggestions. Structure with clear headings. Aim for understanding and critical thinking, not just memorization. Use $...$ for inline math and $$...$$ for display math (limits, fractions, equations)."""
-        text = _generate_with_llm(prompt, document_context=document_context, course_name=course_name)
+        document_context = _load_document_context(document_filenames)
+        text = _generate_study_guide(course_name, topic, document_context, regenerate=bool(data.get('regenerate')))
         return jsonify({'study_guide': text, 'course_name': course_name, 'topic': topic or None}), 200
     except Exception as e:
         logger.error(str(e))
         return jsonify({'error': str(e)}), 500
 
 
+MAX_BATCH_TOPICS = 8
+STUDY_GUIDE_TOKENS = 1500  # output budget per guide in a batched call
+
+
+def _generate_study_guides_batched(course_name, topics, document_context=""):
+    """
+    One LLM call for several study guides: the model returns a JSON object
+    {"study_guides": [{"index": i, "study_guide": "..."}]} in JSON mode.
+    Returns a list of guides aligned with topics; entries the model left out are None.
+    """
+    numbered = "\n".join(f"{i}. {topic}" for i, topic in enumerate(topics))
+    prompt = f"""Create a concise study guide for {course_name} for EACH of the following topics. For each topic include key concepts, definitions, and short practice suggestions, structured with clear headings. Aim for understanding and critical thinking, not just memorization. Use $...$ for inline math and $$...$$ for display math (limits, fractions, equations).
+
+Topics:
+{numbered}
+
+Respond with a JSON object of the form {{"study_guides": [{{"index": <topic number>, "study_guide": "<markdown study guide>"}}]}}, with exactly one entry per topic."""
+    r = llm_client.get_completion(
+        user_message=prompt,
+        system_prompt=_generator_system_prompt(course_name, document_context),
+        conversation_history=[],
+        temperature=0.6,
+        max_tokens=min(STUDY_GUIDE_TOKENS * len(topics), LLM_MAX_OUTPUT_TOKENS),
+        response_format={'type': 'json_object'},
+    )
+    guides = [None] * len(topics)
+    try:
+        parsed = orjson.loads(r.get('content') or '')
+        for entry in parsed.get('study_guides') or []:
+            idx = entry.get('index')
+            if isinstance(idx, int) and 0 <= idx < len(topics) and isinstance(entry.get('study_guide'), str):
+                guides[idx] = entry['study_guide'].strip()
+    except (orjson.JSONDecodeError, AttributeError) as e:
+        logger.warning("Batched study guide response was not valid JSON: %s", e)
+    return guides
+
+
+@app.route('/api/generate-study-guide/batch', methods=['POST'])
+def generate_study_guide_batch():
+    """
+    Generate study guides for several topics with as few LLM calls as the output token cap
+    allows (each call covers LLM_MAX_OUTPUT_TOKENS // STUDY_GUIDE_TOKENS topics); the calls,
+    and the per-topic retries for anything the model dropped, run concurrently.
+    Body: course_name, topics (list of str, up to 8), document_filenames (optional), regenerate (optional).
+    Returns JSON: { "course_name": str, "study_guides": [{"topic": str, "study_guide": str}, ...] } in topic order.
+    """
+    try:
+        data = request.get_json() or {}
+        course_name = (data.get('course_name') or 'your course').strip()
+        topics = [t.strip() for t in (data.get('topics') or []) if isinstance(t, str) and t.strip()]
+        if not topics:
+            return jsonify({'error': 'Missing topics'}), 400
+        if len(topics) > MAX_BATCH_TOPICS:
+            return jsonify({'error': f'At most {MAX_BATCH_TOPICS} topics per batch'}), 400
+        document_context = _load_document_context(data.get('document_filenames') or [])
+        regenerate = bool(data.get('regenerate'))
+        per_call = max(1, LLM_MAX_OUTPUT_TOKENS // STUDY_GUIDE_TOKENS)
+        groups = [topics[i:i + per_call] for i in range(0, len(topics), per_call)]
+        
+        def generate_group(group):
+            return _generate_study_guides_batched(course_name, group, document_context)
+        
+        def generate_one(i):
+            return _generate_study_guide(course_name, topics[i], document_context, regenerate=regenerate)
+        
+        with ThreadPoolExecutor(max_workers=min(LLM_BATCH_CONCURRENCY, len(topics))) as executor:
+            guides = [guide for group_guides in executor.map(generate_group, groups) for guide in group_guides]
+            # Anything the model dropped or mangled is generated individually
+            missing = [i for i, guide in enumerate(guides) if not guide]
+            for i, guide in zip(missing, executor.map(generate_one, missing)):
+                guides[i] = guide
+        return jsonify({
+            'course_name': course_name,
+            'study_guides': [{'topic': t, 'study_guide': g} for t, g in zip(topics, guides)],
+        }), 200
+    except Exception as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/generate-practice-exam', methods=['POST'])
 def generate_practice_exam():
     """Generate practice exam questions (generalized, not only from PDF). Body: course_name, topic (optional), document_filenames (optional)."""
@@ -893,57 +1527,173 @@ def generate_practice_exam():
         course_name = (data.get('course_name') or 'your course').strip()
         topic = (data.get('topic') or '').strip()
         document_filenames = data.get('document_filenames') or []
-        document_context = ""
-        for filename in document_filenames:
-            filepath = UPLOADS_DIR / filename
-            if filepath.exists():
-                content = read_file_content(filepath)
-                if content:
-                    document_context += f"\n--- {filename} ---\n{content}\n"
-        scope = f" focused on: {topic}" if topic else ""
-        prompt = f"""Generate a short practice exam (5-8 questions) for {course_name}{scope}. Mix question types: conceptual, short answer, and application. Base questions on the course material; if reference materials are provided below, use them. Do not give answers—only the questions. Format as a numbered list with clear questions. Use $...$ for inline math (e.g. $f(x)$, $x \\\\to 2$) and $$...$$ for display equations (e.g. limits, fractions on their own line)."""
-        if document_context:
-            prompt += f"\n\nReference materials:\n{document_context}"
-        text = _generate_with_llm(prompt, document_context="", course_name=course_name)
+        document_context = _load_document_context(document_filenames)
+        text = _generate_practice_exam(course_name, topic, document_context)
         return jsonify({'practice_exam': text, 'course_name': course_name, 'topic': topic or None}), 200
     except Exception as e:
         logger.error(str(e))
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/generate-batch', methods=['POST'])
+def generate_batch():
+    """
+    Generate several study guides / practice exams in one request, with the LLM calls in flight concurrently.
+    Body: { "items": [{"kind": "study_guide" | "practice_exam", "course_name": str, "topic": str (optional),
+                       "document_filenames": [...] (optional), "regenerate": bool (optional)}, ...] }
+    Returns JSON: { "results": [{"kind", "course_name", "topic", "study_guide" | "practice_exam"} or {"error"}, ...] }
+    in request order.
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Missing items'}), 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({'error': f'At most {MAX_BATCH_ITEMS} items per batch'}), 400
+        
+        def run(item):
+            if not isinstance(item, dict) or item.get('kind') not in GENERATORS:
+                return {'error': f"Unknown kind; expected one of {sorted(GENERATORS)}"}
+            generate, field = GENERATORS[item['kind']]
+            course_name = (item.get('course_name') or 'your course').strip()
+            topic = (item.get('topic') or '').strip()
+            document_context = _load_document_context(item.get('document_filenames') or [])
+            # Without "regenerate", each kind keeps its default (study guides cached, exams fresh)
+            options = {'regenerate': bool(item['regenerate'])} if 'regenerate' in item else {}
+            return {
+                'kind': item['kind'],
+                'course_name': course_name,
+                'topic': topic or None,
+                field: generate(course_name, topic, document_context, **options),
+            }
+        
+        with ThreadPoolExecutor(max_workers=min(LLM_BATCH_CONCURRENCY, len(items))) as executor:
+            results = list(executor.map(run, items))
+        return jsonify({'results': results}), 200
+    except Exception as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), 500
+
+
+# Proxies (nginx honours X-Accel-Buffering) must pass each event through as soon as it is written;
+# Flask-Compress leaves these alone because COMPRESS_MIMETYPES only lists JSON
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+
+def _sse(payload):
+    """Frame a JSON payload as a server-sent event, as bytes ready for the WSGI server."""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+# Deltas are merged into one frame until this many characters are pending or this long has
+# passed since the last frame; the first delta is always sent on its own for time-to-first-token
+SSE_FLUSH_CHARS = 64
+SSE_FLUSH_INTERVAL = 0.015
+
+
+def _stream_llm_round(messages, parts):
+    """
+    Forward one streamed completion to the client as SSE delta frames,
+    collecting the text in parts. Returns the final 'done' or 'error' event.
+    """
+    final = {'type': 'done', 'finish_reason': 'stop', 'tool_calls': []}
+    pending = []
+    pending_chars = 0
+    last_flush = 0.0  # flush the first delta immediately
+    for event in llm_client.stream_completion_events(messages, tools=TOOLS):
+        if event['type'] == 'delta':
+            parts.append(event['content'])
+            pending.append(event['content'])
+            pending_chars += len(event['content'])
+            now = time.monotonic()
+            if pending_chars >= SSE_FLUSH_CHARS or now - last_flush >= SSE_FLUSH_INTERVAL:
+                yield _sse({'delta': ''.join(pending)})
+                pending.clear()
+                pending_chars = 0
+                last_flush = now
+        else:
+            final = event
+    if pending:
+        yield _sse({'delta': ''.join(pending)})
+    return final
+
+
 @app.route('/api/chat/stream', methods=['POST'])
 def chat_stream():
     """
-    Handle streaming chat requests (for future enhancement).
+    Streaming variant of /api/chat (same request body).
+    Emits server-sent events: {"delta": "..."} per batch of tokens, then
+    {"done": true, "response": ..., "citations": ..., "similar_question": ...}
+    and a terminal [DONE]. Failures mid-stream are sent as {"error": "..."}.
     """
     try:
-        data = request.get_json()
+        if _chat_body_too_large():
+            return jsonify({'error': 'Request body too large'}), 413
+        data = _parse_json_body()
         
-        if not data or 'message' not in data:
+        if not isinstance(data, dict) or 'message' not in data:
             return jsonify({'error': 'Missing message in request'}), 400
         
-        user_message = data['message']
-        course_name = data.get('course_name', 'your course')
+        session_id = _get_session_id(data)
+        canned = _canned_chat_turn(data, session_id)
+        if canned is not None:
+            frames = [_sse({'delta': canned['response']}), _sse({'done': True, **canned}), SSE_DONE]
+            resp = app.response_class(frames, mimetype='text/event-stream', headers=SSE_HEADERS)
+            return _with_session_cookie(resp, session_id)
         
-        system_prompt = f"""You are an AI homework helper for students. 
-You are currently helping with {course_name}. 
-Provide clear, educational explanations. Break down complex concepts step by step.
-Be encouraging and supportive."""
-        
-        # Get streaming response from Azure LLM
-        response_stream = llm_client.get_streaming_completion(
-            user_message=user_message,
-            system_prompt=system_prompt
-        )
+        ctx = _build_chat_context(data, session_id)
+        cached_response, cache_key, semantic_vector = _lookup_cached_response(ctx)
         
         def generate():
-            for chunk in response_stream:
-                yield f"data: {chunk}\n\n"
+            try:
+                if cached_response is not None:
+                    ai_response = cached_response
+                    yield _sse({'delta': cached_response})
+                else:
+                    parts = []
+                    messages = [{'role': 'system', 'content': ctx['system_prompt']}]
+                    messages.extend(ctx['conversation_history'] or [{'role': 'user', 'content': ctx['user_message']}])
+                    final = yield from _stream_llm_round(messages, parts)
+                    
+                    # The model asked for tools mid-stream: run them, then stream the follow-up answer
+                    used_tools = final['type'] == 'done' and bool(final['tool_calls'])
+                    if used_tools:
+                        logger.debug("LLM requested %d tool call(s) while streaming", len(final['tool_calls']))
+                        followup = _tool_followup_messages(
+                            ctx['system_prompt'], ctx['user_message'], ''.join(parts) or None, final['tool_calls']
+                        )
+                        final = yield from _stream_llm_round(followup, parts)
+                    
+                    if final['type'] == 'error':
+                        yield _sse({'error': final['error']})
+                        yield SSE_DONE
+                        return
+                    
+                    ai_response = ''.join(parts)
+                    _store_cached_response(
+                        ctx, cache_key, semantic_vector, ai_response, final['finish_reason'], used_tools
+                    )
+                
+                out = _finish_chat_turn(ctx, ai_response)
+                yield _sse({'done': True, **out})
+            except Exception as e:
+                logger.error("Error while streaming chat response: %s", e)
+                yield _sse({'error': str(e)})
+            yield SSE_DONE
         
-        return app.response_class(generate(), mimetype='text/event-stream')
+        resp = app.response_class(
+            generate(),
+            mimetype='text/event-stream',
+            headers=SSE_HEADERS,
+        )
+        return _with_session_cookie(resp, ctx['session_id'])
         
     except Exception as e:
-        logger.error(f"Error processing streaming chat request: {str(e)}")
+        logger.error("Error processing streaming chat request: %s", e)
         return jsonify({
             'error': 'Failed to process streaming chat request',
             'details': str(e)
@@ -951,5 +1701,7 @@ Be encouraging and supportive."""
 
 
 if __name__ == '__main__':
+    # Development fallback only; production runs `gunicorn -c gunicorn.conf.py app:app` (see Procfile).
+    # The debugger/reloader is opt-in via FLASK_DEBUG=1.
     logger.info("Starting AI Learning Helper Backend Server...")
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    app.run(host='0.0.0.0', port=5001, debug=os.getenv('FLASK_DEBUG') == '1', threaded=True)
@@ -4,27 +4,186 @@ SQLite persistence for learning and personalization:
 - chat_history: per-user, per-course conversation history
 - mistakes: recorded mistakes for weak-area tracking and weekly review
 - study_plans: adaptive study plan JSON per user
+- semantic_cache: embedded prompts and LLM responses for the semantic response cache (keyed by scope)
 """
-import json
+import atexit
+import functools
 import logging
+import queue
 import re
 import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Deque, Dict, FrozenSet, List, Optional, Tuple
+
+import orjson
 
 logger = logging.getLogger(__name__)
 
 DB_DIR = Path(__file__).parent
 DB_PATH = DB_DIR / "learning_helper.db"
 
+READ_POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 256  # prepared statements kept per pooled connection, keyed by SQL text
+WRITE_RETRIES = 3
+CHAT_WRITE_BATCH = 128
+CHAT_WRITE_INTERVAL = 0.05  # seconds the flusher waits to fill a batch
 
-def get_conn():
-    return sqlite3.connect(DB_PATH)
 
+class _ConnectionPool:
+    """
+    Long-lived connections to one database file in WAL mode: a single writer
+    (SQLite allows one at a time) behind a lock, and up to READ_POOL_SIZE
+    query-only readers that run concurrently with it.
+    """
 
-def init_db():
-    conn = get_conn()
+    def __init__(self, path: Path, read_pool_size: int = READ_POOL_SIZE):
+        self.path = path
+        self.writer = self._connect()
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.write_lock = threading.Lock()
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._reader_slots = threading.Semaphore(read_pool_size)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA cache_size=-20000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire_reader(self) -> sqlite3.Connection:
+        self._reader_slots.acquire()
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._connect()
+                conn.execute("PRAGMA query_only=ON")
+                return conn
+            except Exception:
+                self._reader_slots.release()
+                raise
+
+    def release_reader(self, conn: sqlite3.Connection) -> None:
+        self._readers.put(conn)
+        self._reader_slots.release()
+
+
+_pool: Optional[_ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> _ConnectionPool:
+    global _pool
+    if _pool is None or _pool.path != DB_PATH:
+        with _pool_lock:
+            if _pool is None or _pool.path != DB_PATH:
+                _pool = _ConnectionPool(DB_PATH)
+                _user_id.cache_clear()  # ids belong to the previous database
+    return _pool
+
+
+@contextmanager
+def read_conn():
+    """Borrow a pooled read-only connection."""
+    pool = _get_pool()
+    conn = pool.acquire_reader()
     try:
+        yield conn
+    finally:
+        pool.release_reader(conn)
+
+
+@contextmanager
+def write_conn():
+    """The shared writer connection; commits on success, rolls back on error."""
+    pool = _get_pool()
+    with pool.write_lock:
+        try:
+            yield pool.writer
+            pool.writer.commit()
+        except BaseException:
+            pool.writer.rollback()
+            raise
+
+
+def _retry_locked(func):
+    """Retry a write with exponential backoff if another process holds the database lock."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(WRITE_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == WRITE_RETRIES - 1:
+                    raise
+                time.sleep(0.05 * 2 ** attempt)
+    return wrapper
+
+
+_chat_write_queue: "queue.Queue[Tuple[int, str, str, str]]" = queue.Queue()
+_flusher: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
+
+
+@_retry_locked
+def _insert_chat_turns(rows: List[Tuple[int, str, str, str]]) -> None:
+    with write_conn() as conn:
+        conn.executemany(
+            "INSERT INTO chat_history (user_id, course, role, content) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+
+def _flush_chat_turns() -> None:
+    """Drain queued chat turns, inserting up to CHAT_WRITE_BATCH rows per transaction."""
+    while True:
+        rows = [_chat_write_queue.get()]
+        deadline = time.monotonic() + CHAT_WRITE_INTERVAL
+        while len(rows) < CHAT_WRITE_BATCH:
+            try:
+                rows.append(_chat_write_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        try:
+            _insert_chat_turns(rows)
+        except Exception as e:
+            logger.warning("Failed to save %d chat turns: %s", len(rows), e)
+        finally:
+            for _ in rows:
+                _chat_write_queue.task_done()
+
+
+def _start_flusher() -> None:
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_chat_turns, name="chat-history-flusher", daemon=True)
+            _flusher.start()
+            atexit.register(flush_chat_turns)
+
+
+def flush_chat_turns() -> None:
+    """Block until every queued chat turn has been written."""
+    _chat_write_queue.join()
+
+
+def _wait_for_pending_chat_turns() -> None:
+    """Reads see turns still queued or mid-insert: wait (at most one batch interval) for them."""
+    if _chat_write_queue.unfinished_tasks:
+        flush_chat_turns()
+
+
+def init_db():
+    _start_flusher()
+    with write_conn() as conn:
         conn.executescript("""
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -41,6 +200,8 @@ def init_db():
                 FOREIGN KEY (user_id) REFERENCES users(id)
             );
             CREATE INDEX IF NOT EXISTS idx_chat_user_course ON chat_history(user_id, course);
+            -- Recent-question lookups skip assistant rows instead of reading each one to check its role
+            CREATE INDEX IF NOT EXISTS idx_chat_user_questions ON chat_history(user_id, course) WHERE role = 'user';
             CREATE TABLE IF NOT EXISTS mistakes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
@@ -60,72 +221,77 @@ def init_db():
                 updated_at TEXT DEFAULT (datetime('now')),
                 FOREIGN KEY (user_id) REFERENCES users(id)
             );
+            CREATE TABLE IF NOT EXISTS semantic_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                course TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                response TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                created_at TEXT DEFAULT (datetime('now'))
+            );
+            CREATE INDEX IF NOT EXISTS idx_semantic_cache_course ON semantic_cache(course);
         """)
-        conn.commit()
-    finally:
-        conn.close()
     logger.info("Database initialized at %s", DB_PATH)
 
 
-def get_or_create_user(identifier: str) -> int:
-    if not identifier or not identifier.strip():
-        raise ValueError("identifier is required")
-    conn = get_conn()
-    try:
+@functools.lru_cache(maxsize=10000)
+@_retry_locked
+def _user_id(identifier: str) -> int:
+    """Users are never renamed or deleted, so an identifier's id can be cached for the process lifetime."""
+    with write_conn() as conn:
         cur = conn.execute(
             "SELECT id FROM users WHERE identifier = ?",
-            (identifier.strip(),),
+            (identifier,),
         )
         row = cur.fetchone()
         if row:
             return row[0]
         cur = conn.execute(
             "INSERT INTO users (identifier) VALUES (?)",
-            (identifier.strip(),),
+            (identifier,),
         )
-        conn.commit()
         return cur.lastrowid
-    finally:
-        conn.close()
+
+
+def get_or_create_user(identifier: str) -> int:
+    if not identifier or not identifier.strip():
+        raise ValueError("identifier is required")
+    return _user_id(identifier.strip())
 
 
 def save_chat_turn(user_id: int, course: str, role: str, content: str) -> None:
-    conn = get_conn()
-    try:
-        conn.execute(
-            "INSERT INTO chat_history (user_id, course, role, content) VALUES (?, ?, ?, ?)",
-            (user_id, course, role, content[:10000]),  # cap size
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    """Queue a turn for the background flusher, which batches inserts into one transaction."""
+    _start_flusher()
+    _chat_write_queue.put((user_id, course, role, content[:10000]))  # cap size
 
 
 def get_recent_chat_history(
     user_id: int,
     course: str,
     limit: int = 30,
+    max_chars: int = 4000,
 ) -> List[Dict[str, str]]:
-    conn = get_conn()
-    try:
+    """Most recent turns, oldest first, each truncated to max_chars in SQL for use as prompt context."""
+    _wait_for_pending_chat_turns()
+    with read_conn() as conn:
         cur = conn.execute(
             """
-            SELECT role, content FROM chat_history
+            SELECT role, substr(content, 1, ?) FROM chat_history
             WHERE user_id = ? AND course = ?
             ORDER BY id DESC LIMIT ?
             """,
-            (user_id, course, limit),
+            (max_chars, user_id, course, limit),
         )
-        rows = cur.fetchall()
-        out = [{"role": r, "content": c} for r, c in reversed(rows)]
-        return out
-    finally:
-        conn.close()
+        # Rows arrive newest first; prepending while iterating the cursor yields oldest-first order
+        out: Deque[Dict[str, str]] = deque(maxlen=limit)
+        for role, content in cur:
+            out.appendleft({"role": role, "content": content})
+        return list(out)
 
 
 def get_recent_user_questions(user_id: int, course: str, limit: int = 20) -> List[str]:
-    conn = get_conn()
-    try:
+    _wait_for_pending_chat_turns()
+    with read_conn() as conn:
         cur = conn.execute(
             """
             SELECT content FROM chat_history
@@ -135,14 +301,30 @@ def get_recent_user_questions(user_id: int, course: str, limit: int = 20) -> Lis
             (user_id, course, limit),
         )
         return [row[0] for row in cur.fetchall()]
-    finally:
-        conn.close()
+
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
 
 
 def _normalize_for_similarity(text: str) -> str:
-    t = text.lower().strip()
-    t = re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", t))
-    return t
+    """Lowercase, with each run of punctuation/whitespace collapsed to one space."""
+    return _NON_WORD_RE.sub(" ", text.lower()).strip()
+
+
+# Filler that says nothing about a question's subject; questions made only of these
+# ("ok thanks", "what is it") are not compared against past questions at all
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "can", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "so", "that", "the", "this", "to",
+    "was", "what", "when", "where", "which", "who", "why", "with", "you", "your",
+    "hi", "hello", "hey", "ok", "okay", "please", "thanks", "thank", "yes", "no",
+})
+
+
+@functools.lru_cache(maxsize=4096)
+def _question_tokens(text: str) -> FrozenSet[str]:
+    """Normalized token set of a question; past questions recur on every turn, so this is cached."""
+    return frozenset(_normalize_for_similarity(text).split())
 
 
 def find_similar_past_question(
@@ -153,20 +335,20 @@ def find_similar_past_question(
     max_candidates: int = 10,
 ) -> Optional[Dict[str, Any]]:
     """Simple token-overlap similarity to detect repeated/similar questions."""
+    cur_tokens = _question_tokens(current_question)
+    if not cur_tokens - _STOPWORDS:
+        return None
     past = get_recent_user_questions(user_id, course, limit=max_candidates)
     if not past:
         return None
-    cur_norm = _normalize_for_similarity(current_question)
-    cur_tokens = set(cur_norm.split())
-    if not cur_tokens:
-        return None
+    current = current_question.strip()
+    for p in past:
+        if p.strip() == current:
+            return {"question": p, "similarity": 1.0, "note": "Same question asked before."}
     best_ratio = 0.0
     best_question = None
     for p in past:
-        if p.strip() == current_question.strip():
-            return {"question": p, "similarity": 1.0, "note": "Same question asked before."}
-        p_norm = _normalize_for_similarity(p)
-        p_tokens = set(p_norm.split())
+        p_tokens = _question_tokens(p)
         if not p_tokens:
             continue
         overlap = len(cur_tokens & p_tokens) / max(len(cur_tokens), len(p_tokens))
@@ -179,8 +361,7 @@ def find_similar_past_question(
 
 
 def get_mistakes(user_id: int, course: Optional[str] = None) -> List[Dict[str, Any]]:
-    conn = get_conn()
-    try:
+    with read_conn() as conn:
         if course:
             cur = conn.execute(
                 """
@@ -211,10 +392,25 @@ def get_mistakes(user_id: int, course: Optional[str] = None) -> List[Dict[str, A
             }
             for r in rows
         ]
-    finally:
-        conn.close()
 
 
+def get_mistakes_version(user_id: int, course: Optional[str] = None) -> Tuple[int, int]:
+    """(count, max id) of a user's mistakes; changes whenever one is added or deleted."""
+    with read_conn() as conn:
+        if course:
+            cur = conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM mistakes WHERE user_id = ? AND course = ?",
+                (user_id, course),
+            )
+        else:
+            cur = conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM mistakes WHERE user_id = ?",
+                (user_id,),
+            )
+        return tuple(cur.fetchone())
+
+
+@_retry_locked
 def add_mistake(
     user_id: int,
     course: str,
@@ -222,8 +418,7 @@ def add_mistake(
     correction: str = "",
     topic: Optional[str] = None,
 ) -> int:
-    conn = get_conn()
-    try:
+    with write_conn() as conn:
         cur = conn.execute(
             """
             INSERT INTO mistakes (user_id, course, topic, question, correction)
@@ -231,28 +426,21 @@ def add_mistake(
             """,
             (user_id, course, topic or "", question[:2000], correction[:2000]),
         )
-        conn.commit()
         return cur.lastrowid
-    finally:
-        conn.close()
 
 
+@_retry_locked
 def delete_mistake(mistake_id: int, user_id: int) -> bool:
-    conn = get_conn()
-    try:
+    with write_conn() as conn:
         cur = conn.execute(
             "DELETE FROM mistakes WHERE id = ? AND user_id = ?",
             (mistake_id, user_id),
         )
-        conn.commit()
         return cur.rowcount > 0
-    finally:
-        conn.close()
 
 
 def get_study_plan(user_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    try:
+    with read_conn() as conn:
         cur = conn.execute(
             "SELECT plan_json, updated_at FROM study_plans WHERE user_id = ?",
             (user_id,),
@@ -260,14 +448,12 @@ def get_study_plan(user_id: int) -> Optional[Dict[str, Any]]:
         row = cur.fetchone()
         if not row:
             return None
-        return {"plan": json.loads(row[0]), "updated_at": row[1]}
-    finally:
-        conn.close()
+        return {"plan": orjson.loads(row[0]), "updated_at": row[1]}
 
 
+@_retry_locked
 def save_study_plan(user_id: int, plan: Dict[str, Any]) -> None:
-    conn = get_conn()
-    try:
+    with write_conn() as conn:
         conn.execute(
             """
             INSERT INTO study_plans (user_id, plan_json, updated_at)
@@ -276,8 +462,28 @@ def save_study_plan(user_id: int, plan: Dict[str, Any]) -> None:
                 plan_json = excluded.plan_json,
                 updated_at = datetime('now')
             """,
-            (user_id, json.dumps(plan)),
+            (user_id, orjson.dumps(plan).decode()),
         )
-        conn.commit()
-    finally:
-        conn.close()
+
+
+@_retry_locked
+def save_semantic_cache_entry(scope: str, prompt: str, response: str, embedding: bytes) -> None:
+    with write_conn() as conn:
+        conn.execute(
+            "INSERT INTO semantic_cache (course, prompt, response, embedding) VALUES (?, ?, ?, ?)",
+            (scope, prompt[:2000], response[:10000], embedding),
+        )
+
+
+def get_semantic_cache_entries(scope: str, limit: int = 500) -> List[Tuple[str, str, bytes]]:
+    """Most recent cached (prompt, response, embedding) rows for a cache scope, oldest first."""
+    with read_conn() as conn:
+        cur = conn.execute(
+            """
+            SELECT prompt, response, embedding FROM semantic_cache
+            WHERE course = ?
+            ORDER BY id DESC LIMIT ?
+            """,
+            (scope, limit),
+        )
+        return list(reversed(cur.fetchall()))
@@ -0,0 +1,37 @@
+"""
+Gunicorn settings for serving the backend in production:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Chat requests spend almost all of their time waiting on Azure OpenAI and
+Wolfram Alpha, so gevent workers are used: each worker keeps many requests
+in flight while they await HTTP instead of serving them one at a time.
+The LLM client and tool schemas are created per worker at import time.
+"""
+import logging
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+worker_class = "gevent"
+# The workload is I/O-bound (LLM calls), so with SESSION_BACKEND=redis default to 2 workers per CPU;
+# override with WEB_CONCURRENCY. Chat sessions in the default in-memory store are per process, so a
+# turn routed to another worker would lose its history: without redis a single worker is used.
+_shared_sessions = os.getenv("SESSION_BACKEND", "memory").strip().lower() == "redis"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 if _shared_sessions else 1))
+if workers > 1 and not _shared_sessions:
+    logging.getLogger("gunicorn.error").warning(
+        "WEB_CONCURRENCY=%s needs SESSION_BACKEND=redis to share chat history between workers; "
+        "running 1 worker", workers,
+    )
+    workers = 1
+worker_connections = 1000
+timeout = 120
+
+
+def post_worker_init(worker):
+    """Warm each worker's LLM connection pool in the background once the app is loaded."""
+    import threading
+    from app import llm_client
+
+    threading.Thread(target=llm_client.warm_up, daemon=True).start()
@@ -1,7 +1,9 @@
 import os
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
+import orjson
 from typing import Optional, Generator, List, Dict, Any
 from dotenv import load_dotenv
 
@@ -11,6 +13,36 @@ logger = logging.getLogger(__name__)
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
 
+SSE_READ_SIZE = 8192
+
+
+class _ThrottleRetry(Retry):
+    """Retry whose Retry-After handling covers only 429 (urllib3 also retries 413 and 503)."""
+    RETRY_AFTER_STATUS_CODES = frozenset({429})
+
+
+def iter_sse_data(response: requests.Response) -> Generator[bytes, None, None]:
+    """
+    Yield the payload of each `data:` line in a streamed server-sent events
+    response. Lines are split on raw bytes, so nothing is decoded here; the
+    payload goes straight to orjson.
+    """
+    buffer = bytearray()
+    for chunk in response.iter_content(chunk_size=SSE_READ_SIZE):
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b'\n', start)
+            if end == -1:
+                break
+            if buffer.startswith(b'data:', start, end):
+                yield bytes(buffer[start + 5:end]).strip()
+            start = end + 1
+        del buffer[:start]
+    if buffer.startswith(b'data:'):
+        yield bytes(buffer[5:]).strip()
+
+
 class AzureLLMClient:
     """Client for interacting with Azure OpenAI deployment"""
     
@@ -26,9 +58,40 @@ class AzureLLMClient:
         
         self.headers = {
             'Content-Type': 'application/json',
+            'Connection': 'keep-alive',
             'api-key': self.api_key
         }
         
+        # One pooled session per client: keep-alive connections are reused across
+        # requests instead of paying a TCP + TLS handshake on every LLM call.
+        # Completions are POSTs and not idempotent, so only failures where the request
+        # was never processed are retried: connection errors and throttling (429, after
+        # its Retry-After). A 5xx or a dropped response may follow a completed (billed)
+        # generation and is not re-sent; the final response is still returned so
+        # raise_for_status reports it.
+        self.session = requests.Session()
+        retry = _ThrottleRetry(
+            total=2,
+            connect=2,
+            read=0,
+            backoff_factor=0.2,
+            status_forcelist=[429],
+            allowed_methods=frozenset({'GET', 'HEAD', 'POST'}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=64, pool_maxsize=64, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # Optional embeddings deployment (used by the semantic response cache)
+        self.embedding_endpoint = os.getenv('AZURE_EMBEDDING_ENDPOINT')
+        self.embedding_headers = {
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive',
+            'api-key': os.getenv('AZURE_EMBEDDING_API_KEY') or self.api_key
+        }
+        
         logger.info("Azure LLM Client initialized successfully")
     
     def get_completion(
@@ -38,7 +101,8 @@ class AzureLLMClient:
         temperature: float = 0.7,
         max_tokens: int = 1000,
         tools: Optional[List[Dict[str, Any]]] = None,
-        conversation_history: Optional[List[Dict[str, str]]] = None
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        response_format: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Get a completion from Azure OpenAI with optional function calling support.
@@ -50,6 +114,7 @@ class AzureLLMClient:
             max_tokens: Maximum tokens in response
             tools: Optional list of tool definitions for function calling
             conversation_history: Optional conversation history (list of {role, content})
+            response_format: Optional response format, e.g. {"type": "json_object"} for JSON mode
             
         Returns:
             Dict with 'content' (str), 'tool_calls' (list), and 'finish_reason' (str)
@@ -87,18 +152,21 @@ class AzureLLMClient:
                 payload['tools'] = tools
                 payload['tool_choice'] = 'auto'
             
+            if response_format:
+                payload['response_format'] = response_format
+            
             logger.info(f"Sending request to Azure OpenAI endpoint")
             
-            response = requests.post(
+            response = self.session.post(
                 self.endpoint,
                 headers=self.headers,
-                json=payload,
+                data=orjson.dumps(payload),
                 timeout=60
             )
             
             response.raise_for_status()
             
-            result = response.json()
+            result = orjson.loads(response.content)
             
             if 'choices' in result and len(result['choices']) > 0:
                 choice = result['choices'][0]
@@ -174,15 +242,15 @@ class AzureLLMClient:
                 payload['tools'] = tools
                 payload['tool_choice'] = 'auto'
             
-            response = requests.post(
+            response = self.session.post(
                 self.endpoint,
                 headers=self.headers,
-                json=payload,
+                data=orjson.dumps(payload),
                 timeout=60
             )
             
             response.raise_for_status()
-            result = response.json()
+            result = orjson.loads(response.content)
             
             if 'choices' in result and len(result['choices']) > 0:
                 choice = result['choices'][0]
@@ -227,20 +295,48 @@ class AzureLLMClient:
         Yields:
             Chunks of the AI's response text
         """
-        try:
-            messages = []
-            
-            if system_prompt:
-                messages.append({
-                    'role': 'system',
-                    'content': system_prompt
-                })
-            
+        messages = []
+        
+        if system_prompt:
             messages.append({
-                'role': 'user',
-                'content': user_message
+                'role': 'system',
+                'content': system_prompt
             })
+        
+        messages.append({
+            'role': 'user',
+            'content': user_message
+        })
+        
+        for event in self.stream_completion_events(messages, temperature=temperature, max_tokens=max_tokens):
+            if event['type'] == 'delta':
+                yield event['content']
+            elif event['type'] == 'error':
+                yield f"Error: {event['error']}"
+    
+    def stream_completion_events(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 1000
+    ) -> Generator[Dict[str, Any], None, None]:
+        """
+        Stream a chat completion as events, with function calling support.
+        
+        Args:
+            messages: Full message list (system, history, user, tool results)
+            tools: Optional list of tool definitions for function calling
+            temperature: Controls randomness (0-1)
+            max_tokens: Maximum tokens in response
             
+        Yields:
+            {'type': 'delta', 'content': str} for each content token, then one
+            {'type': 'done', 'finish_reason': str, 'tool_calls': list} once the
+            stream ends (tool call arguments reassembled from their deltas), or
+            {'type': 'error', 'error': str} if the request failed
+        """
+        try:
             payload = {
                 'messages': messages,
                 'temperature': temperature,
@@ -251,35 +347,101 @@ class AzureLLMClient:
                 'stream': True
             }
             
+            if tools:
+                payload['tools'] = tools
+                payload['tool_choice'] = 'auto'
+            
             logger.info(f"Sending streaming request to Azure OpenAI endpoint")
             
-            response = requests.post(
+            response = self.session.post(
                 self.endpoint,
                 headers=self.headers,
-                json=payload,
+                data=orjson.dumps(payload),
                 stream=True,
                 timeout=60
             )
             
             response.raise_for_status()
             
-            for line in response.iter_lines():
-                if line:
-                    line_text = line.decode('utf-8')
-                    if line_text.startswith('data: '):
-                        data_str = line_text[6:]
-                        if data_str.strip() == '[DONE]':
-                            break
-                        try:
-                            data = json.loads(data_str)
-                            if 'choices' in data and len(data['choices']) > 0:
-                                delta = data['choices'][0].get('delta', {})
-                                content = delta.get('content', '')
-                                if content:
-                                    yield content
-                        except json.JSONDecodeError:
-                            continue
+            finish_reason = 'stop'
+            tool_calls: Dict[int, Dict[str, Any]] = {}
+            
+            for data_bytes in iter_sse_data(response):
+                if data_bytes == b'[DONE]':
+                    break
+                try:
+                    data = orjson.loads(data_bytes)
+                except orjson.JSONDecodeError:
+                    continue
+                if 'choices' not in data or len(data['choices']) == 0:
+                    continue
+                choice = data['choices'][0]
+                delta = choice.get('delta') or {}
+                content = delta.get('content')
+                if content:
+                    yield {'type': 'delta', 'content': content}
+                # Tool calls arrive in fragments keyed by index; arguments are concatenated
+                for tc in delta.get('tool_calls') or []:
+                    call = tool_calls.setdefault(tc.get('index', 0), {
+                        'id': '',
+                        'type': 'function',
+                        'function': {'name': '', 'arguments': ''}
+                    })
+                    if tc.get('id'):
+                        call['id'] = tc['id']
+                    fn = tc.get('function') or {}
+                    if fn.get('name'):
+                        call['function']['name'] += fn['name']
+                    if fn.get('arguments'):
+                        call['function']['arguments'] += fn['arguments']
+                if choice.get('finish_reason'):
+                    finish_reason = choice['finish_reason']
+            
+            yield {
+                'type': 'done',
+                'finish_reason': finish_reason,
+                'tool_calls': [tool_calls[i] for i in sorted(tool_calls)]
+            }
                             
         except Exception as e:
             logger.error(f"Error in streaming completion: {str(e)}")
-            yield f"Error: {str(e)}"
+            yield {'type': 'error', 'error': str(e)}
+    
+    def get_embedding(self, text: str) -> Optional[List[float]]:
+        """
+        Get an embedding vector for text from the Azure OpenAI embeddings deployment.
+        
+        Args:
+            text: Text to embed
+            
+        Returns:
+            The embedding as a list of floats, or None if embeddings are not
+            configured or the request failed
+        """
+        if not self.embedding_endpoint:
+            return None
+        try:
+            response = self.session.post(
+                self.embedding_endpoint,
+                headers=self.embedding_headers,
+                data=orjson.dumps({'input': text}),
+                timeout=15
+            )
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+            return result['data'][0]['embedding']
+        except Exception as e:
+            logger.error(f"Error in get_embedding: {str(e)}")
+            return None
+    
+    def warm_up(self) -> None:
+        """
+        Open pooled connections to the completion and embedding hosts ahead of the
+        first request, so no user pays the TCP + TLS handshake. The response status
+        is irrelevant; failures are only logged.
+        """
+        for url in {self.endpoint, self.embedding_endpoint} - {None}:
+            try:
+                self.session.head(url, timeout=5)
+            except requests.exceptions.RequestException as e:
+                logger.warning("Warm-up request to %s failed: %s", url, e)
@@ -0,0 +1,74 @@
+"""
+Parallel per-page PDF text extraction.
+PyMuPDF holds the GIL and is not thread-safe, so large documents are split into
+page ranges that separate pdf_worker.py processes open and extract independently.
+The workers are plain scripts rather than a multiprocessing pool: a spawned pool
+child re-imports the parent's main module (app.py under `python app.py`), while
+pdf_worker.py imports only fitz.
+
+Extraction stays in-process under gevent, for small documents, and whenever a
+worker cannot be started or fails, so a valid upload always gets its pages.
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+
+from pdf_worker import extract_page_range
+
+logger = logging.getLogger(__name__)
+
+PARALLEL_MIN_PAGES = 64  # below this, process start-up costs more than it saves
+WORKER_SCRIPT = str(Path(__file__).with_name("pdf_worker.py"))
+WORKER_TIMEOUT = 120  # seconds per page range
+
+
+def _under_gevent() -> bool:
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("socket")
+
+
+def _extract_in_workers(path: str, ranges: List[Tuple[int, int]]) -> List[Tuple[int, str]]:
+    procs = [
+        subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, path, str(start), str(stop)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        for start, stop in ranges
+    ]
+    try:
+        pages = []
+        for proc in procs:
+            out, err = proc.communicate(timeout=WORKER_TIMEOUT)
+            if proc.returncode != 0:
+                raise RuntimeError(f"pdf_worker exited with {proc.returncode}: {err.decode(errors='replace')[-500:]}")
+            pages.extend((page, text) for page, text in json.loads(out))
+        return pages
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+
+def extract_page_texts(path: str) -> List[Tuple[int, str]]:
+    """(page number, text) for every page, fanned out across processes for large PDFs."""
+    with fitz.open(path) as doc:
+        page_count = doc.page_count
+    workers = min(os.cpu_count() or 1, max(1, page_count // (PARALLEL_MIN_PAGES // 2)))
+    if page_count < PARALLEL_MIN_PAGES or workers < 2 or _under_gevent():
+        return extract_page_range(path, 0, page_count)
+
+    step = -(-page_count // workers)
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    try:
+        return _extract_in_workers(path, ranges)
+    except Exception as e:
+        logger.warning("Parallel PDF extraction failed (%s); extracting %s in-process", e, path)
+        return extract_page_range(path, 0, page_count)
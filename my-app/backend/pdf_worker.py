@@ -0,0 +1,24 @@
+"""
+Worker for parallel PDF extraction, run as a separate script:
+
+    python pdf_worker.py <path> <start> <stop>
+
+prints [[page number, text], ...] for pages [start, stop) as JSON on stdout.
+It imports only fitz, so workers never load app.py or its clients.
+"""
+import json
+import sys
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+
+
+def extract_page_range(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """(1-based page number, text) for pages [start, stop)."""
+    with fitz.open(path) as doc:
+        return [(idx + 1, doc[idx].get_text("text") or "") for idx in range(start, stop)]
+
+
+if __name__ == "__main__":
+    fitz.TOOLS.mupdf_display_errors(False)
+    json.dump(extract_page_range(sys.argv[1], int(sys.argv[2]), int(sys.argv[3])), sys.stdout)
@@ -0,0 +1,132 @@
+"""
+Exact-match cache for LLM responses:
+- requests are canonicalized (sorted-key JSON) and hashed with SHA-256
+- backend is selected with LLM_CACHE_BACKEND: "memory" (default) or "redis"
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600
+DEFAULT_MAXSIZE = 1024
+REDIS_KEY_PREFIX = "llm_cache:"
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry expiry, shared by all request threads."""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Redis-backed store so entries are shared across workers."""
+
+    def __init__(self, url: str, key_prefix: str = REDIS_KEY_PREFIX):
+        import redis  # optional dependency, only needed for this backend
+
+        self._client = redis.Redis.from_url(url)
+        self.key_prefix = key_prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(self.key_prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self._client.setex(self.key_prefix + key, ttl, json.dumps(value))
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(self.key_prefix + "*"):
+            self._client.delete(key)
+
+
+def backend_from_env(
+    env_var: str = "LLM_CACHE_BACKEND",
+    key_prefix: str = REDIS_KEY_PREFIX,
+    maxsize: int = DEFAULT_MAXSIZE,
+):
+    """Build the backend named by env_var ("memory" or "redis")."""
+    name = os.getenv(env_var, "memory").strip().lower()
+    if name == "redis":
+        try:
+            return RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"), key_prefix=key_prefix)
+        except Exception as e:
+            logger.warning("Redis backend unavailable for %s (%s); using in-memory store", env_var, e)
+    return MemoryBackend(maxsize=maxsize)
+
+
+class LLMCache:
+    """Short-circuits repeated LLM requests. Cache failures never fail a request."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or backend_from_env(
+            maxsize=int(os.getenv("LLM_CACHE_MAXSIZE", DEFAULT_MAXSIZE))
+        )
+
+    @staticmethod
+    def cache_key(
+        message: str,
+        course_name: str,
+        history: Optional[List[Dict[str, Any]]],
+        tools: Optional[List[Dict[str, Any]]],
+        system_prompt: Optional[str] = None,
+    ) -> str:
+        canonical = json.dumps(
+            {
+                "message": message,
+                "course_name": course_name,
+                "history": history or [],
+                "tools": tools or [],
+                "system_prompt": system_prompt or "",
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.warning("LLM cache get failed: %s", e)
+            return None
+
+    def set(self, key: str, value: Any, ttl: int = DEFAULT_TTL) -> None:
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception as e:
+            logger.warning("LLM cache set failed: %s", e)
+
+    def clear(self) -> None:
+        self.backend.clear()
@@ -0,0 +1,132 @@
+"""
+Semantic cache for LLM responses:
+- paraphrased questions ("solve 3x+5=17" vs "what is x if 3x+5=17") reuse a prior answer
+- a hit also needs the same numbers, operators and functions in the same order, since
+  "solve 2x+3=7" and "solve 2x+5=7" embed as near-duplicates but have different answers
+- prompts are embedded and compared by cosine similarity within a scope (course, user, selected documents)
+- embeddings are quantized to int8, a quarter of the float32 size in memory and in SQLite
+- entries are persisted to SQLite so they survive restarts and are shared between workers on startup
+"""
+import logging
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # semantic caching is disabled without numpy
+    np = None
+
+from db import get_semantic_cache_entries, save_semantic_cache_entry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.95
+MAX_ENTRIES_PER_SCOPE = 500
+INT8_SCALE = 127.0
+
+_MATH_TOKEN_RE = re.compile(
+    r"\d+(?:\.\d+)?|[-+*/^=<>()]|\b(?:sin|cos|tan|sec|csc|cot|log|ln|exp|sqrt)\b"
+)
+
+
+def math_signature(text: str) -> Tuple[str, ...]:
+    """Numbers, operators and function names of a prompt, in order; empty for purely verbal questions."""
+    return tuple(_MATH_TOKEN_RE.findall(text.lower()))
+
+
+def quantize(vector: "np.ndarray") -> "np.ndarray":
+    """Map a unit vector's components from [-1, 1] to int8."""
+    return np.clip(np.rint(vector * INT8_SCALE), -INT8_SCALE, INT8_SCALE).astype(np.int8)
+
+
+class SemanticCache:
+    """Per-scope nearest-neighbour lookup over quantized, normalized prompt embeddings."""
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], Optional[List[float]]],
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = MAX_ENTRIES_PER_SCOPE,
+        enabled: bool = True,
+    ):
+        self._embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = enabled and np is not None
+        # scope -> (n, d) int8 matrix of quantized unit vectors, parallel list of (prompt, response)
+        self._matrices: Dict[str, "np.ndarray"] = {}
+        self._entries: Dict[str, List[Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> Optional["np.ndarray"]:
+        """Embed and L2-normalize text so a dot product is the cosine similarity."""
+        if not self.enabled:
+            return None
+        vector = self._embed_fn(text)
+        if not vector:
+            return None
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        if norm == 0.0:
+            return None
+        return v / norm
+
+    def _load_scope(self, scope: str, dim: int) -> None:
+        """Populate a scope's matrix from SQLite on first use. Caller holds the lock."""
+        if scope in self._matrices:
+            return
+        entries = []
+        vectors = []
+        try:
+            for prompt, response, blob in get_semantic_cache_entries(scope, limit=self.max_entries):
+                if len(blob) != dim:  # different embedding model or a pre-quantization row
+                    continue
+                entries.append((prompt, response))
+                vectors.append(np.frombuffer(blob, dtype=np.int8))
+        except Exception as e:
+            logger.warning("Failed to load semantic cache for %s: %s", scope, e)
+            entries, vectors = [], []
+        self._entries[scope] = entries
+        self._matrices[scope] = np.vstack(vectors) if vectors else None
+
+    def lookup(self, scope: str, vector: Optional["np.ndarray"], prompt: str) -> Optional[str]:
+        """
+        Return the cached response for the most similar prior prompt with the same
+        math signature as prompt, if similar enough.
+        """
+        if vector is None:
+            return None
+        signature = math_signature(prompt)
+        with self._lock:
+            self._load_scope(scope, vector.shape[0])
+            matrix = self._matrices[scope]
+            if matrix is None or matrix.shape[1] != vector.shape[0]:
+                return None
+            scores = (matrix @ vector) / INT8_SCALE
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for idx in candidates[np.argsort(-scores[candidates])]:
+                cached_prompt, response = self._entries[scope][idx]
+                if math_signature(cached_prompt) == signature:
+                    logger.info("Semantic cache hit (similarity %.3f)", float(scores[idx]))
+                    return response
+            return None
+
+    def add(self, scope: str, prompt: str, response: str, vector: Optional["np.ndarray"]) -> None:
+        if vector is None:
+            return
+        q = quantize(vector)
+        with self._lock:
+            self._load_scope(scope, q.shape[0])
+            matrix = self._matrices[scope]
+            if matrix is None or matrix.shape[1] != q.shape[0]:
+                matrix = q[np.newaxis, :]
+                self._entries[scope] = [(prompt, response)]
+            else:
+                matrix = np.vstack([matrix, q])[-self.max_entries:]
+                self._entries[scope] = (self._entries[scope] + [(prompt, response)])[-self.max_entries:]
+            self._matrices[scope] = matrix
+        try:
+            save_semantic_cache_entry(scope, prompt, response, q.tobytes())
+        except Exception as e:
+            logger.warning("Failed to persist semantic cache entry: %s", e)
@@ -0,0 +1,52 @@
+"""
+Server-side chat sessions, so clients send only the new message each turn:
+- history is stored per (opaque session id, course), so switching course never mixes histories
+- the session id comes from the HttpOnly cookie or `session_id` in the body
+- entries expire after SESSION_TTL seconds of inactivity
+- backend is selected with SESSION_BACKEND: "memory" (default) or "redis"
+"""
+import logging
+import uuid
+from typing import Dict, List, Optional
+
+from response_cache import backend_from_env
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = 86400
+MAX_SESSION_MESSAGES = 40
+
+
+class SessionStore:
+    """Conversation history keyed by session id and course."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or backend_from_env(
+            "SESSION_BACKEND", key_prefix="session:", maxsize=10000
+        )
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def _key(session_id: str, course_name: str) -> str:
+        return f"{session_id}|{course_name}"
+
+    def get_history(self, session_id: Optional[str], course_name: str) -> List[Dict[str, str]]:
+        if not session_id:
+            return []
+        try:
+            return list(self.backend.get(self._key(session_id, course_name)) or [])
+        except Exception as e:
+            logger.warning("Failed to load session history: %s", e)
+            return []
+
+    def append_turn(self, session_id: str, course_name: str, user_message: str, ai_response: str) -> None:
+        history = self.get_history(session_id, course_name)
+        history.append({"role": "user", "content": user_message})
+        history.append({"role": "assistant", "content": ai_response})
+        try:
+            self.backend.set(self._key(session_id, course_name), history[-MAX_SESSION_MESSAGES:], SESSION_TTL)
+        except Exception as e:
+            logger.warning("Failed to save session history: %s", e)
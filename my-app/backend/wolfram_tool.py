@@ -8,6 +8,9 @@ from wolfram_alpha import fetch_question_with_steps
 
 logger = logging.getLogger(__name__)
 
+# Resolved once at import (app.py imports llm_client first, which loads .env)
+_APP_ID = os.getenv('WOLFRAM_APP_ID', 'WL2J62RLKK')
+
 # Tool definition for Azure OpenAI function calling
 WOLFRAM_ALPHA_TOOL = {
     "type": "function",
@@ -39,14 +42,12 @@ def execute_wolfram_tool(problem: str) -> Dict[str, Any]:
         Dict with solution, steps, and metadata
     """
     try:
-        app_id = os.getenv('WOLFRAM_APP_ID', 'WL2J62RLKK')
-        
-        logger.info(f"Executing Wolfram Alpha for problem: {problem}")
+        logger.info("Executing Wolfram Alpha for problem: %s", problem)
         
-        result = fetch_question_with_steps(problem, app_id)
+        result = fetch_question_with_steps(problem, _APP_ID)
         
         if result.get('error'):
-            logger.error(f"Wolfram Alpha error: {result['error']}")
+            logger.error("Wolfram Alpha error: %s", result['error'])
             return {
                 "success": False,
                 "error": result['error'],
@@ -57,7 +58,7 @@ def execute_wolfram_tool(problem: str) -> Dict[str, Any]:
         steps = result.get('steps') or result.get('how_to_solve', '')
         answer = result.get('answer', '')
         
-        logger.info(f"Successfully solved problem with Wolfram Alpha")
+        logger.info("Successfully solved problem with Wolfram Alpha")
         
         return {
             "success": True,
@@ -69,7 +70,7 @@ def execute_wolfram_tool(problem: str) -> Dict[str, Any]:
         }
         
     except Exception as e:
-        logger.error(f"Error executing Wolfram tool: {str(e)}")
+        logger.error("Error executing Wolfram tool: %s", e)
         return {
             "success": False,
             "error": str(e),
@@ -19,6 +19,8 @@ function ChatPanel({ courseName, selectedCourseId, selectedDocuments, panelClass
   const [isLoading, setIsLoading] = useState(false);
   const [useMemory, setUseMemory] = useState(true);
   const [similarQuestionNote, setSimilarQuestionNote] = useState(null);
+  // Server-side conversation session; history lives on the backend, so only the new message is sent
+  const [sessionId, setSessionId] = useState(null);
 
   const greeting = useMemo(
     () => `Ask questions about ${courseName}, assignments, and concepts.`,
@@ -34,6 +36,7 @@ function ChatPanel({ courseName, selectedCourseId, selectedDocuments, panelClass
         text: "Hi! I am your AI homework helper. Ask me anything about your course material.",
       },
     ]);
+    setSessionId(null);
   }, [selectedCourseId]);
 
   async function handleSend(event) {
@@ -50,24 +53,11 @@ function ChatPanel({ courseName, selectedCourseId, selectedDocuments, panelClass
     setMessages((prev) => [...prev, newMessage]);
     setDraft("");
     setIsLoading(true);
+    const aiMessageId = Date.now() + 1;
 
     try {
-      // Build conversation history for the backend (excluding the initial greeting)
-      const conversationHistory = messages
-        .filter(msg => msg.id !== 1) // Exclude initial greeting
-        .map(msg => ({
-          role: msg.sender === "student" ? "user" : "assistant",
-          content: msg.text
-        }));
-      
-      // Add the new message
-      conversationHistory.push({
-        role: "user",
-        content: cleanDraft
-      });
-
-      // Call backend API with conversation history and personalization
-      const response = await fetch(`${config.API_BASE_URL}/api/chat`, {
+      // Call the streaming chat API so tokens render as they arrive
+      const response = await fetch(`${config.API_BASE_URL}/api/chat/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -75,45 +65,84 @@ function ChatPanel({ courseName, selectedCourseId, selectedDocuments, panelClass
         body: JSON.stringify({
           message: cleanDraft,
           course_name: courseName,
-          conversation_history: conversationHistory,
+          session_id: sessionId,
           document_filenames: selectedDocuments,
           user_identifier: getUserIdentifier(),
           use_memory: useMemory,
         }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Failed to get response from AI');
       }
 
-      const data = await response.json();
-      if (data.similar_question) {
-        setSimilarQuestionNote(data.similar_question.note || "You asked something similar before.");
-      } else {
-        setSimilarQuestionNote(null);
-      }
+      // Add an empty AI message (store for "Add to mistakes") and fill it in as deltas arrive
+      setMessages((prev) => [
+        ...prev,
+        {
+          id: aiMessageId,
+          sender: "assistant",
+          text: "",
+          linkedUserMessage: cleanDraft,
+          citations: [],
+        },
+      ]);
+      const updateAiMessage = (changes) =>
+        setMessages((prev) =>
+          prev.map((m) => (m.id === aiMessageId ? { ...m, ...changes } : m))
+        );
 
-      // Add AI response to messages (store for "Add to mistakes")
-      const aiMessage = {
-        id: Date.now() + 1,
-        sender: "assistant",
-        text: data.response,
-        linkedUserMessage: cleanDraft,
-        citations: data.citations || [],
-      };
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let fullText = "";
+      let streamDone = false;
 
-      setMessages((prev) => [...prev, aiMessage]);
+      while (!streamDone) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-sent events are separated by a blank line
+        const frames = buffer.split("\n\n");
+        buffer = frames.pop();
+        for (const frame of frames) {
+          if (!frame.startsWith("data: ")) continue;
+          const payload = frame.slice(6);
+          if (payload === "[DONE]") {
+            streamDone = true;
+            break;
+          }
+          const event = JSON.parse(payload);
+          if (event.error) {
+            throw new Error(event.error);
+          }
+          if (event.delta) {
+            fullText += event.delta;
+            updateAiMessage({ text: fullText });
+          }
+          if (event.done) {
+            if (event.session_id) setSessionId(event.session_id);
+            updateAiMessage({ text: event.response ?? fullText, citations: event.citations || [] });
+            if (event.similar_question) {
+              setSimilarQuestionNote(event.similar_question.note || "You asked something similar before.");
+            } else {
+              setSimilarQuestionNote(null);
+            }
+          }
+        }
+      }
     } catch (error) {
       console.error('Error calling AI:', error);
       
-      // Add error message
+      // Replace any partially streamed answer with an error message
       const errorMessage = {
-        id: Date.now() + 1,
+        id: aiMessageId,
         sender: "assistant",
         text: "Sorry, I encountered an error. Please make sure the backend server is running and try again.",
       };
 
-      setMessages((prev) => [...prev, errorMessage]);
+      setMessages((prev) => [...prev.filter((m) => m.id !== aiMessageId), errorMessage]);
     } finally {
       setIsLoading(false);
     }
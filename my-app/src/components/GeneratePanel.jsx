@@ -52,6 +52,8 @@ function GeneratePanel({
   const [loadingExam, setLoadingExam] = useState(false);
 
   async function generateStudyGuide() {
+    // Asking again for a guide already shown should give a fresh one, not the cached text
+    const regenerate = Boolean(studyGuide);
     setLoadingGuide(true);
     setStudyGuide("");
     try {
@@ -62,6 +64,7 @@ function GeneratePanel({
           course_name: courseName,
           topic: topic.trim() || undefined,
           document_filenames: selectedDocuments || [],
+          regenerate,
         }),
       });
       const data = await res.json();
@@ -10,6 +10,8 @@ function WeeklyReviewPanel({ courseName, panelClassName = "" }) {
   const [loading, setLoading] = useState(false);
 
   async function generateReview() {
+    // Asking again after a review is shown should give fresh prompts, not the cached ones
+    const regenerate = Boolean(fullText);
     setLoading(true);
     setPrompts([]);
     setFullText("");
@@ -20,6 +22,7 @@ function WeeklyReviewPanel({ courseName, panelClassName = "" }) {
         body: JSON.stringify({
           user_identifier: getUserIdentifier(),
           course: courseName || undefined,
+          regenerate,
         }),
       });
       const data = await res.json();
@@ -8,19 +8,33 @@ and the arithmetic to students (rather than just giving answers).
 Setup:
   1. Get a free AppID at https://developer.wolframalpha.com/portal/myapps
   2. Set WOLFRAM_APP_ID env var or paste AppID below (env var recommended for GitHub)
-  3. pip install requests
+  3. pip install requests (optionally orjson for faster JSON load/dump)
   4. For HTTP server (my-app backend): pip install flask flask-cors
+     python wolfram_alpha.py --server [--port 5000] [--workers N]
+     (--workers N serves with N gunicorn gevent workers: pip install gunicorn gevent)
 """
 
+import atexit
 import json
 import os
+import shutil
 import sys
+import threading
 import time
 import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; the stdlib json module is used without it
+    orjson = None
 
 # Optional: paste AppID here if you prefer (env var takes precedence)
 WOLFRAM_APP_ID = "WL2J62RLKK"
@@ -182,6 +196,56 @@ PODSTATE_ALTERNATIVES = [
 ]
 
 
+# One pooled session for all queries: keep-alive reuses the TCP connection across the
+# batch in main() and across requests to the server / chat tool. Throttling (429) and
+# transient 5xx responses are retried with backoff.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+atexit.register(_SESSION.close)
+
+# (connect, read) seconds
+REQUEST_TIMEOUT = (3.05, 30)
+
+UPLOAD_COPY_BUFFER = 1 << 20
+
+# Upload suffixes, dot included so Path.suffix can be checked directly
+ALLOWED_EXTENSIONS = frozenset({
+    ".pdf", ".png", ".jpg", ".jpeg", ".gif", ".webp",
+    ".txt", ".md", ".csv", ".json",
+    ".doc", ".docx", ".ppt", ".pptx", ".xls", ".xlsx",
+})
+
+# main() fetches this many questions at once; each worker pauses between its questions
+# so the batch stays within the API's rate limits
+MAX_CONCURRENT_QUESTIONS = 5
+QUESTION_PAUSE_SECONDS = 1
+
+# Solved questions are remembered in-process, keyed by (normalized question, app_id)
+RESULT_CACHE_TTL = 24 * 3600
+RESULT_CACHE_MAXSIZE = 1024
+_RESULT_CACHE: Dict[Tuple[str, str], Tuple[float, dict]] = {}
+_RESULT_CACHE_LOCK = threading.Lock()
+_RESULT_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def _json_dumps(obj, indent: bool = False) -> bytes:
+    """UTF-8 JSON, via orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode()
+
+
+def _json_loads(data: bytes):
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the latter
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
 def query_wolfram(
     question: str,
     app_id: str,
@@ -201,7 +265,7 @@ def query_wolfram(
     if podstate:
         params["podstate"] = podstate
 
-    response = requests.get(base_url, params=params, timeout=30)
+    response = _SESSION.get(base_url, params=params, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
     return response.json()
 
@@ -235,57 +299,99 @@ def extract_pods_data(result: dict) -> List[dict]:
     return pods
 
 
+def _query_podstate(question: str, app_id: str, podstate: str) -> Optional[dict]:
+    """API result for one podstate, or None if the request failed or was unsuccessful."""
+    try:
+        result = query_wolfram(question, app_id, podstate=podstate)
+    except requests.RequestException:
+        return None  # Network/API error - try the next podstate
+    if not result.get("queryresult", {}).get("success"):
+        return None
+    return result
+
+
 def fetch_question_with_steps(question: str, app_id: str) -> dict:
     """
     Fetch a question's solution from Wolfram Alpha, attempting step-by-step first.
     Falls back to standard result if steps aren't available (e.g., free tier).
+    Successful results are cached for RESULT_CACHE_TTL seconds.
     """
-    # Try with step-by-step podstate first
-    for podstate in [PODSTATE_STEPS] + PODSTATE_ALTERNATIVES:
-        try:
-            result = query_wolfram(question, app_id, podstate=podstate)
-            query_result = result.get("queryresult", {})
-
-            if not query_result.get("success"):
-                error_msg = query_result.get("error", {}).get("msg", "Unknown error")
-                continue  # Try next podstate
-
-            pods = extract_pods_data(result)
-
-            # Build structured output for LLM use
-            steps_content = ""
-            result_content = ""
-            input_interpretation = ""
-
-            for pod in pods:
-                if "step" in pod["title"].lower() or "step" in pod["id"].lower():
-                    steps_content += pod["content"] + "\n\n"
-                elif "result" in pod["id"].lower() or "result" in pod["title"].lower():
-                    result_content = pod["content"]
-                elif "input" in pod["id"].lower():
-                    input_interpretation = pod["content"]
-
-            # If we got steps, great; otherwise use whatever we have
-            # Use our plain-English "how to solve" when available; otherwise Wolfram's steps
-            how_to = HOW_TO_SOLVE.get(question, "")
-            wolfram_steps = steps_content.strip() if steps_content else _format_pods_as_steps(pods)
-            steps = how_to if how_to else wolfram_steps
-
-            return {
-                "question": question,
-                "input_interpretation": input_interpretation or question,
-                "answer": result_content or (pods[0]["content"] if pods else ""),
-                "steps": steps,
-                "how_to_solve": how_to,
-                "all_pods": [
-                    {"title": p["title"], "content": p["content"]}
-                    for p in pods
-                ],
-            }
-
-        except requests.RequestException as e:
-            # Network/API error - will retry without podstate below
-            pass
+    key = (_normalize_question(question), app_id)
+    now = time.time()
+    with _RESULT_CACHE_LOCK:
+        entry = _RESULT_CACHE.get(key)
+        if entry is not None and now - entry[0] < RESULT_CACHE_TTL:
+            _RESULT_CACHE_STATS["hits"] += 1
+            return entry[1]
+        _RESULT_CACHE.pop(key, None)  # expired
+        _RESULT_CACHE_STATS["misses"] += 1
+
+    result = _fetch_question_uncached(question, app_id)
+    if "error" not in result:
+        with _RESULT_CACHE_LOCK:
+            if len(_RESULT_CACHE) >= RESULT_CACHE_MAXSIZE:
+                _RESULT_CACHE.pop(next(iter(_RESULT_CACHE)))  # oldest insertion
+            _RESULT_CACHE[key] = (now, result)
+    return result
+
+
+def cache_clear() -> None:
+    """Drop all cached results and reset the hit/miss counters."""
+    with _RESULT_CACHE_LOCK:
+        _RESULT_CACHE.clear()
+        _RESULT_CACHE_STATS.update(hits=0, misses=0)
+
+
+def cache_stats() -> dict:
+    with _RESULT_CACHE_LOCK:
+        return {**_RESULT_CACHE_STATS, "size": len(_RESULT_CACHE), "ttl": RESULT_CACHE_TTL}
+
+
+def _fetch_question_uncached(question: str, app_id: str) -> dict:
+    # Try with step-by-step podstate first; if that fails, probe the alternatives
+    # concurrently and keep the first that succeeds, in priority order
+    result = _query_podstate(question, app_id, PODSTATE_STEPS)
+    if result is None:
+        with ThreadPoolExecutor(max_workers=len(PODSTATE_ALTERNATIVES)) as executor:
+            alternatives = executor.map(
+                lambda podstate: _query_podstate(question, app_id, podstate),
+                PODSTATE_ALTERNATIVES,
+            )
+            result = next((r for r in alternatives if r is not None), None)
+
+    if result is not None:
+        pods = extract_pods_data(result)
+
+        # Build structured output for LLM use
+        steps_content = ""
+        result_content = ""
+        input_interpretation = ""
+
+        for pod in pods:
+            if "step" in pod["title"].lower() or "step" in pod["id"].lower():
+                steps_content += pod["content"] + "\n\n"
+            elif "result" in pod["id"].lower() or "result" in pod["title"].lower():
+                result_content = pod["content"]
+            elif "input" in pod["id"].lower():
+                input_interpretation = pod["content"]
+
+        # If we got steps, great; otherwise use whatever we have
+        # Use our plain-English "how to solve" when available; otherwise Wolfram's steps
+        how_to = _HOW_TO_NORM.get(_normalize_question(question), "")
+        wolfram_steps = steps_content.strip() if steps_content else _format_pods_as_steps(pods)
+        steps = how_to if how_to else wolfram_steps
+
+        return {
+            "question": question,
+            "input_interpretation": input_interpretation or question,
+            "answer": result_content or (pods[0]["content"] if pods else ""),
+            "steps": steps,
+            "how_to_solve": how_to,
+            "all_pods": [
+                {"title": p["title"], "content": p["content"]}
+                for p in pods
+            ],
+        }
 
     # Fallback: query without podstate to get at least the answer
     try:
@@ -298,7 +404,7 @@ def fetch_question_with_steps(question: str, app_id: str) -> dict:
                 result_content = pod["content"]
                 break
 
-        how_to = HOW_TO_SOLVE.get(question, "")
+        how_to = _HOW_TO_NORM.get(_normalize_question(question), "")
         wolfram_steps = _format_pods_as_steps(pods)
         combined_steps = how_to if how_to else wolfram_steps
 
@@ -314,7 +420,7 @@ def fetch_question_with_steps(question: str, app_id: str) -> dict:
             ],
         }
     except requests.RequestException as e:
-        how_to = HOW_TO_SOLVE.get(question, "")
+        how_to = _HOW_TO_NORM.get(_normalize_question(question), "")
         return {
             "question": question,
             "input_interpretation": "",
@@ -361,16 +467,68 @@ def _normalize_question(q: str) -> str:
     return " ".join(q.lower().strip().split())
 
 
-def _lookup_in_cache(question: str, cache: List[dict]) -> Optional[dict]:
+# HOW_TO_SOLVE keyed by normalized question, so case/spacing variants still match
+_HOW_TO_NORM = {_normalize_question(k): v for k, v in HOW_TO_SOLVE.items()}
+
+
+class _CacheIndex(NamedTuple):
+    """
+    wolfram_questions.json entries with their questions normalized, and their
+    /api/query response bodies serialized, once at load time.
+    """
+    exact: Dict[str, dict]  # normalized question -> first item with it
+    normalized: List[Tuple[str, dict]]  # (normalized question, item) in file order
+    responses: Dict[int, bytes]  # id(item) -> JSON response body
+    postings: Dict[str, List[int]]  # trigram -> positions in normalized that contain it
+    gram_counts: List[int]  # number of distinct trigrams per position
+    short: List[int]  # positions under 3 characters, always candidates
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _build_cache_index(cache: List[dict]) -> _CacheIndex:
+    exact: Dict[str, dict] = {}
+    normalized = []
+    responses = {}
+    postings: Dict[str, List[int]] = {}
+    gram_counts = []
+    for pos, item in enumerate(cache):
+        norm = _normalize_question(item.get("question", ""))
+        exact.setdefault(norm, item)
+        normalized.append((norm, item))
+        responses[id(item)] = _json_dumps(_query_response(item))
+        grams = _trigrams(norm)
+        for gram in grams:
+            postings.setdefault(gram, []).append(pos)
+        gram_counts.append(len(grams))
+    short = [pos for pos, n in enumerate(gram_counts) if n == 0]
+    return _CacheIndex(exact, normalized, responses, postings, gram_counts, short)
+
+
+def _lookup_in_cache(question: str, index: _CacheIndex) -> Optional[dict]:
     """Find a matching question in the wolfram_questions.json cache."""
     norm = _normalize_question(question)
-    for item in cache:
-        if _normalize_question(item.get("question", "")) == norm:
-            return item
-    # Fuzzy: check if question is a substring or vice versa
-    for item in cache:
-        q = item.get("question", "")
-        if norm in _normalize_question(q) or _normalize_question(q) in norm:
+    item = index.exact.get(norm)
+    if item is not None:
+        return item
+    # Fuzzy: check if question is a substring or vice versa. A substring's trigrams are
+    # all in the longer string, so the postings narrow both directions to candidates
+    # before the substring test: cached questions holding every query trigram, and
+    # cached questions whose trigrams all occur in the query.
+    grams = _trigrams(norm)
+    if grams:
+        lists = sorted((index.postings.get(g, []) for g in grams), key=len)
+        candidates = set(lists[0]).intersection(*lists[1:])
+    else:
+        candidates = set(range(len(index.normalized)))
+    shared = Counter(pos for g in grams for pos in index.postings.get(g, ()))
+    candidates.update(pos for pos, n in shared.items() if n == index.gram_counts[pos])
+    candidates.update(index.short)
+    for pos in sorted(candidates):
+        q_norm, item = index.normalized[pos]
+        if norm in q_norm or q_norm in norm:
             return item
     return None
 
@@ -379,39 +537,57 @@ def _format_chat_response(item: dict) -> str:
     """Format a cached/Wolfram result as chat-friendly text for my-app."""
     steps = item.get("how_to_solve") or item.get("steps") or ""
     answer = item.get("answer", "")
-    parts = []
-    if steps:
-        parts.append(steps)
-    if answer and answer not in steps:
-        parts.append(f"\nFinal answer: {answer}")
-    return "\n".join(parts).strip() if parts else answer or "No result."
+    final = f"\n\nFinal answer: {answer}" if answer and answer not in steps else ""
+    if not (steps or final):
+        return answer or "No result."
+    return (steps + final).strip()
+
+
+def _query_response(item: dict) -> dict:
+    """/api/query JSON body for a cached or freshly fetched result."""
+    return {
+        "text": _format_chat_response(item),
+        "answer": item.get("answer", ""),
+        "steps": item.get("steps", ""),
+        "how_to_solve": item.get("how_to_solve", ""),
+    }
+
+
+# Constant error responses, serialized once: (JSON body, status)
+_ERR_EMPTY_QUESTION = (_json_dumps({"text": "Please ask a math question.", "answer": "", "steps": ""}), 400)
+_ERR_NOT_CACHED = (_json_dumps({
+    "text": "Question not in cache. Set WOLFRAM_APP_ID to query Wolfram Alpha live.",
+    "answer": "",
+    "steps": "",
+}), 404)
+_ERR_NO_FILE_PART = (_json_dumps({"error": "No file part in request"}), 400)
+_ERR_NO_FILE_SELECTED = (_json_dumps({"error": "No file selected"}), 400)
+_ERR_INVALID_FILENAME = (_json_dumps({"error": "Invalid filename"}), 400)
+_ERR_FILE_NOT_FOUND = (_json_dumps({"error": "File not found"}), 404)
 
 
-def run_server(port: int = 5000):
+def create_app():
     """
-    Run an HTTP API server compatible with my-app.
+    Build the HTTP API app compatible with my-app.
     Serves GET /api/query?q=<question> returning JSON suitable for the chat.
     Uses wolfram_questions.json first; falls back to Wolfram API if WOLFRAM_APP_ID set.
     """
-    try:
-        from flask import Flask, jsonify, request  # type: ignore
-        from flask_cors import CORS  # type: ignore
-    except ImportError:
-        print("For server mode, install: pip install flask flask-cors")
-        return 1
+    from flask import Flask, Response, jsonify, request, send_from_directory  # type: ignore
+    from flask_cors import CORS  # type: ignore
 
     app = Flask(__name__)
     CORS(app)
+    app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE") == "1"
 
     script_dir = Path(__file__).resolve().parent
     cache_path = script_dir / "wolfram_questions.json"
     cache = []
     if cache_path.exists():
         try:
-            with open(cache_path) as f:
-                cache = json.load(f)
+            cache = _json_loads(cache_path.read_bytes())
         except json.JSONDecodeError:
             pass
+    cache_index = _build_cache_index(cache)
 
     app_id = os.environ.get("WOLFRAM_APP_ID") or WOLFRAM_APP_ID
 
@@ -419,19 +595,16 @@ def run_server(port: int = 5000):
     upload_dir = script_dir / "uploads"
     upload_dir.mkdir(exist_ok=True)
 
-    ALLOWED_EXTENSIONS = {
-        ".pdf", ".png", ".jpg", ".jpeg", ".gif", ".webp",
-        ".txt", ".md", ".csv", ".json",
-        ".doc", ".docx", ".ppt", ".pptx", ".xls", ".xlsx",
-    }
+    def error_response(err: Tuple[bytes, int]):
+        return Response(err[0], status=err[1], mimetype="application/json")
 
     @app.route("/api/upload", methods=["POST"])
     def api_upload():
         if "file" not in request.files:
-            return jsonify({"error": "No file part in request"}), 400
+            return error_response(_ERR_NO_FILE_PART)
         file = request.files["file"]
         if file.filename == "":
-            return jsonify({"error": "No file selected"}), 400
+            return error_response(_ERR_NO_FILE_SELECTED)
 
         ext = Path(file.filename).suffix.lower()
         if ext not in ALLOWED_EXTENSIONS:
@@ -448,8 +621,10 @@ def run_server(port: int = 5000):
             save_path = upload_dir / f"{stem}_{counter}{ext}"
             counter += 1
 
-        file.save(str(save_path))
-        size = save_path.stat().st_size
+        # Copy in 1 MiB blocks and take the size from the write position (no stat afterwards)
+        with open(save_path, "wb") as dst:
+            shutil.copyfileobj(file.stream, dst, UPLOAD_COPY_BUFFER)
+            size = dst.tell()
         return jsonify({
             "filename": save_path.name,
             "size": size,
@@ -459,44 +634,93 @@ def run_server(port: int = 5000):
 
     @app.route("/api/uploads")
     def api_uploads():
-        files = []
-        for f in sorted(upload_dir.iterdir(), key=lambda x: x.stat().st_mtime, reverse=True):
-            if f.is_file():
-                files.append({
-                    "filename": f.name,
-                    "size": f.stat().st_size,
-                    "type": f.suffix.lstrip("."),
-                    "path": str(f),
-                })
+        # scandir gives the file type for free and DirEntry caches its stat, so each
+        # file costs one stat for both the sort key and the size
+        entries = []
+        with os.scandir(upload_dir) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    entries.append((entry.stat().st_mtime, entry))
+        entries.sort(key=lambda e: e[0], reverse=True)
+        files = [{
+            "filename": entry.name,
+            "size": entry.stat().st_size,
+            "type": Path(entry.name).suffix.lstrip("."),
+            "path": entry.path,
+        } for _, entry in entries]
         return jsonify({"files": files})
 
+    @app.route("/api/files/<filename>")
+    def api_file(filename):
+        # Conditional + ETag so re-downloads revalidate with a 304; with USE_X_SENDFILE=1
+        # a fronting proxy streams the file itself via sendfile
+        safe_name = Path(filename).name
+        if safe_name != filename or Path(safe_name).suffix.lower() not in ALLOWED_EXTENSIONS:
+            return error_response(_ERR_INVALID_FILENAME)
+        if not (upload_dir / safe_name).is_file():
+            return error_response(_ERR_FILE_NOT_FOUND)
+        return send_from_directory(upload_dir, safe_name, conditional=True, etag=True)
+
+    @app.route("/api/cache/stats")
+    def api_cache_stats():
+        return jsonify(cache_stats())
+
     # ── Query endpoint ────────────────────────────────────────────
     @app.route("/api/query")
     def api_query():
         q = request.args.get("q", "").strip()
         if not q:
-            return jsonify({"text": "Please ask a math question.", "answer": "", "steps": ""}), 400
+            return error_response(_ERR_EMPTY_QUESTION)
 
         # 1. Lookup in cache (wolfram_questions.json)
-        item = _lookup_in_cache(q, cache)
+        item = _lookup_in_cache(q, cache_index)
         if item:
-            text = _format_chat_response(item)
-            return jsonify({"text": text, "answer": item.get("answer", ""), "steps": item.get("steps", ""), "how_to_solve": item.get("how_to_solve", "")})
+            return Response(cache_index.responses[id(item)], mimetype="application/json")
 
         # 2. Fallback to Wolfram API if app_id available
         if app_id:
             try:
                 result = fetch_question_with_steps(q, app_id)
-                text = _format_chat_response(result)
-                return jsonify({"text": text, "answer": result.get("answer", ""), "steps": result.get("steps", ""), "how_to_solve": result.get("how_to_solve", "")})
+                return jsonify(_query_response(result))
             except Exception as e:
                 return jsonify({"text": f"Sorry, I couldn't solve that. ({e})", "answer": "", "steps": ""}), 500
 
-        return jsonify({"text": "Question not in cache. Set WOLFRAM_APP_ID to query Wolfram Alpha live.", "answer": "", "steps": ""}), 404
+        return error_response(_ERR_NOT_CACHED)
+
+    return app
 
+
+def _print_endpoints(port: int) -> None:
     print(f"Wolfram API server at http://localhost:{port}")
     print("  GET /api/query?q=<question>  -> JSON { text, answer, steps }")
+    print("  GET /api/cache/stats         -> JSON { hits, misses, size, ttl }")
+    print("  GET /api/files/<filename>    -> uploaded file")
     print("  Compatible with my-app chat (use fetch or proxy to this URL)")
+
+
+def run_server(port: int = 5000, workers: int = 0):
+    """
+    Serve create_app() on the given port. With workers > 0, exec gunicorn with that many
+    gevent workers instead of the single-process development server; gevent patches
+    sockets, so requests waiting on Wolfram Alpha no longer block each other.
+    """
+    if workers > 0:
+        _print_endpoints(port)
+        try:
+            os.execvp("gunicorn", [
+                "gunicorn", "-k", "gevent", "-w", str(workers), "-b", f"0.0.0.0:{port}",
+                "--chdir", str(Path(__file__).resolve().parent), "wolfram_alpha:create_app()",
+            ])
+        except FileNotFoundError:
+            print("For --workers, install: pip install gunicorn gevent")
+            return 1
+
+    try:
+        app = create_app()
+    except ImportError:
+        print("For server mode, install: pip install flask flask-cors")
+        return 1
+    _print_endpoints(port)
     app.run(host="0.0.0.0", port=port, debug=False)
     return 0
 
@@ -517,38 +741,51 @@ def main():
 
     print(f"Fetching {len(questions)} algebra/calculus questions from Wolfram Alpha...\n")
 
-    for i, q in enumerate(questions, 1):
-        print(f"[{i}/{len(questions)}] {q}")
+    def fetch_paced(q: str) -> dict:
         item = fetch_question_with_steps(q, app_id)
-        results.append(item)
         # Rate limit: avoid hammering the API
-        time.sleep(1)
+        time.sleep(QUESTION_PAUSE_SECONDS)
+        return item
 
-    # Write JSON (for programmatic use by your LLM pipeline)
-    output_json = "wolfram_questions.json"
-    with open(output_json, "w") as f:
-        json.dump(results, f, indent=2)
-
-    print(f"\nSaved full results to {output_json}")
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_QUESTIONS) as executor:
+        for i, (q, item) in enumerate(zip(questions, executor.map(fetch_paced, questions)), 1):
+            print(f"[{i}/{len(questions)}] {q}")
+            results.append(item)
 
-    # Write prompt-ready text (for pasting into LLM context)
+    # JSON (for programmatic use by your LLM pipeline)
+    output_json = "wolfram_questions.json"
+    # Prompt-ready text (for pasting into LLM context)
+    # Each item's context is built once, reused for the preview, and the file written in one call
+    contexts = [generate_llm_prompt_context(item) for item in results]
     output_txt = "wolfram_questions_for_llm.txt"
-    with open(output_txt, "w") as f:
-        f.write(
-            "Use the following questions and reference solutions to explain each step "
-            "and the arithmetic to students. Do not simply give the final answer.\n\n"
-        )
-        for item in results:
-            f.write(generate_llm_prompt_context(item))
 
-    print(f"Saved LLM prompt context to {output_txt}")
+    def write_json() -> None:
+        with open(output_json, "wb") as f:
+            f.write(_json_dumps(results, indent=True))
+
+    def write_txt() -> None:
+        with open(output_txt, "w") as f:
+            f.write("".join([
+                "Use the following questions and reference solutions to explain each step "
+                "and the arithmetic to students. Do not simply give the final answer.\n\n",
+                *contexts,
+            ]))
+
+    # The two files are independent, so write them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        json_written = executor.submit(write_json)
+        txt_written = executor.submit(write_txt)
+        json_written.result()
+        print(f"\nSaved full results to {output_json}")
+        txt_written.result()
+        print(f"Saved LLM prompt context to {output_txt}")
 
     # Preview - show first few with full step-by-step
     print("\n" + "=" * 60)
     print("PREVIEW: How to solve (first 3 questions)")
     print("=" * 60)
-    for i, item in enumerate(results[:3], 1):
-        print(generate_llm_prompt_context(item))
+    for context in contexts[:3]:
+        print(context)
     print("\n... (see wolfram_questions.json and wolfram_questions_for_llm.txt for all 15)")
 
     return 0
@@ -557,11 +794,18 @@ def main():
 if __name__ == "__main__":
     if "--server" in sys.argv or "-s" in sys.argv:
         port = 5000
+        workers = 0
         try:
             i = sys.argv.index("--port")
             if i + 1 < len(sys.argv):
                 port = int(sys.argv[i + 1])
         except (ValueError, IndexError):
             pass
-        exit(run_server(port))
+        try:
+            i = sys.argv.index("--workers")
+            if i + 1 < len(sys.argv):
+                workers = int(sys.argv[i + 1])
+        except (ValueError, IndexError):
+            pass
+        exit(run_server(port, workers))
     exit(main())